@@ -6,5 +6,6 @@ setup(
     packages=find_packages(where="src"),
     package_dir={"": "src"},
     python_requires=">=3.10",
+    extras_require={"local": ["numpy"]},
 )
 
@@ -1,3 +1,3 @@
-from .spork import col, lit, row_number, lag
+from .spork import col, lit, row_number, lag, lead, rank, dense_rank, count, count_distinct, sum, avg, min, max, median
 from .query import Selection, Dataset, Join, Query, Entity
 from spork.window import Window, unbounded_preceding, unbounded_following, current_row
@@ -0,0 +1,321 @@
+"""
+Index advisor: proposes composite indexes (or sort/cluster keys) for a workload of queries, ranked
+by estimated benefit, and verifies them against a local engine.
+
+Every query contributes, per table it reads:
+- equality and range predicates of its where clause and join conditions, with equalities between
+  two tables counting as equalities on both (the join key of a lookup),
+- its order by or group by columns, when they all belong to that table, and
+- the partition and order keys of its windows.
+
+Candidate indexes put equality columns first, most selective first, followed by either a range
+column or the ordering columns. A candidate's benefit for a query is the share of the table's rows
+it saves reading, plus a fixed amount when it also saves a sort; its score is the weighted sum of
+its benefits over the workload.
+"""
+import re
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from spork.analysis import (
+    conjuncts,
+    is_identifier,
+    is_leaf,
+    leaf_text,
+    parse_literal,
+    split_ref,
+    windows,
+)
+from spork.entity import Entity
+from spork.expression import Expression
+from spork.harness import Backend, Snapshot, SQLiteBackend, Table, measure
+from spork.query import Query
+from spork.stats import Statistics, selectivity
+from spork.types import NullCheck, Op
+
+
+# Benefit of an index that saves a sort, relative to one that filters out every row
+SORT_BENEFIT = 0.5
+
+_RANGES = {Op.LT, Op.LEQ, Op.GT, Op.GEQ}
+
+Workload = Sequence[Union[Query, Tuple[Query, float]]]
+
+
+class _Access:
+    """
+    How one query reads one table: selectivities of the equality and range predicates on its
+    columns, and the column order that would save a sort.
+    """
+
+    def __init__(self, table: str, query: int, weight: float):
+        self.table = table
+        self.query = query
+        self.weight = weight
+        self.eq: Dict[str, float] = {}
+        self.ranges: Dict[str, float] = {}
+        self.order: List[str] = []
+        # Lowercased column names as first written
+        self.names: Dict[str, str] = {}
+
+    def benefit(self, columns: Tuple[str, ...]) -> float:
+        s, i = 1.0, 0
+        while i < len(columns) and columns[i] in self.eq:
+            s *= self.eq[columns[i]]
+            i += 1
+        if i < len(columns) and columns[i] in self.ranges:
+            s *= self.ranges[columns[i]]
+
+        benefit = 1 - s
+        # Equality columns are constant, so they do not have to be sorted on
+        order = [c for c in self.order if c not in self.eq]
+        if order and list(columns[i : i + len(order)]) == order:
+            benefit += SORT_BENEFIT
+        return self.weight * benefit
+
+
+class IndexProposal:
+    def __init__(self, table: str, columns: Tuple[str, ...], score: float, queries: List[int]):
+        self.table = table
+        self.columns = columns
+        self.score = score
+        # Positions in the workload of the queries that benefit
+        self.queries = queries
+
+    @property
+    def name(self) -> str:
+        return re.sub(r"\W", "_", f"ix_{self.table}_{'_'.join(self.columns)}")
+
+    def create_sql(self) -> str:
+        return f"create index {self.name} on {self.table} ({', '.join(self.columns)})"
+
+    def cluster_sql(self) -> str:
+        return f"alter table {self.table} cluster by ({', '.join(self.columns)})"
+
+    def __repr__(self) -> str:
+        return f"IndexProposal({self.table} ({', '.join(self.columns)}): {self.score:.3f})"
+
+
+def _column(exp, sources: Dict[str, str]) -> Optional[Tuple[str, str]]:
+    """
+    The (alias, column) a bare column reference resolves to, if any. Bare names are only resolved
+    when the query reads a single table.
+    """
+    if isinstance(exp, Expression):
+        if not is_leaf(exp) or exp.cast_to or exp.negate or exp.null_check:
+            return None
+        exp = leaf_text(exp)
+    if not isinstance(exp, str) or not is_identifier(exp) or parse_literal(exp)[0]:
+        return None
+
+    qualifier, _ = split_ref(exp)
+    name = exp.split(".")[-1]
+    if qualifier is None:
+        return (next(iter(sources)), name) if len(sources) == 1 else None
+    return (qualifier, name) if qualifier in sources else None
+
+
+def _accesses(query: Query, n: int, weight: float, stats: Statistics) -> List[_Access]:
+    sources: Dict[str, str] = {}
+    subqueries = []
+    for what in [query.dataset.entity] + [j.what for j in query.dataset.joins]:
+        if isinstance(what, Entity):
+            sources[(what._alias or what.ref.split(".")[-1]).lower()] = what.ref
+        elif isinstance(what, Query) and what.dataset:
+            subqueries.append(what)
+    stats = stats.with_aliases(sources)
+
+    # Columns are keyed by their lowercased name, and rendered as first written
+    names: Dict[Tuple[str, str], str] = {}
+    accesses: Dict[str, _Access] = {}
+
+    def access(alias: str) -> _Access:
+        if alias not in accesses:
+            accesses[alias] = _Access(sources[alias], n, weight)
+        return accesses[alias]
+
+    def key(ref: Tuple[str, str]) -> str:
+        names.setdefault((sources[ref[0]], ref[1].lower()), ref[1])
+        return ref[1].lower()
+
+    def predicate(c: Expression):
+        if c.negate or c.cast_to:
+            return
+        if c.op is None and c.null_check == NullCheck.IS_NULL:
+            ref = _column(c.lhs, sources)
+            if ref:
+                access(ref[0]).eq[key(ref)] = selectivity(c, stats)
+        elif c.null_check:
+            return
+        elif c.op == Op.BETWEEN:
+            ref = _column(c.lhs, sources)
+            if ref:
+                access(ref[0]).ranges[key(ref)] = selectivity(c, stats)
+        elif c.op == Op.EQ or c.op in _RANGES:
+            lhs, rhs = _column(c.lhs, sources), _column(c.rhs, sources)
+            s = selectivity(c, stats)
+            for ref in (lhs, rhs):
+                if ref and not (lhs and rhs and lhs[0] == rhs[0]):
+                    target = access(ref[0]).eq if c.op == Op.EQ else access(ref[0]).ranges
+                    target[key(ref)] = min(s, target.get(key(ref), 1.0))
+
+    for join in query.dataset.joins:
+        for c in conjuncts(join.on):
+            predicate(c)
+    for c in conjuncts(query._where):
+        predicate(c)
+
+    found = []
+    for exps in (query._order_by, query._group_by):
+        refs = [_column(e, sources) for e in exps or []]
+        if refs and all(refs) and len({r[0] for r in refs}) == 1:
+            access(refs[0][0]).order = [key(r) for r in refs]
+            break
+
+    exps = list(query.selection.cols) + ([query._qualify] if query._qualify is not None else [])
+    for w in (w for e in exps for w in windows(e)):
+        refs = [_column(p, sources) for p in (w.partitionby, w.orderby) if p is not None]
+        if refs and all(refs) and len({r[0] for r in refs}) == 1:
+            a = _Access(sources[refs[0][0]], n, weight)
+            a.order = [key(r) for r in refs]
+            found.append(a)
+
+    found.extend(accesses.values())
+    for a in found:
+        a.names = {c: names[(a.table, c)] for c in list(a.eq) + list(a.ranges) + a.order}
+    for sub in subqueries:
+        found.extend(_accesses(sub, n, weight, stats))
+    return found
+
+
+def _candidates(a: _Access) -> List[Tuple[str, ...]]:
+    eq = sorted(a.eq, key=lambda c: (a.eq[c], c))
+    candidates = []
+    if eq:
+        candidates.append(tuple(eq))
+    if a.ranges:
+        best = min(a.ranges, key=lambda c: (a.ranges[c], c))
+        if best not in a.eq:
+            candidates.append(tuple(eq + [best]))
+    order = [c for c in a.order if c not in a.eq]
+    if order:
+        candidates.append(tuple(eq + order))
+    return candidates
+
+
+def advise(
+    workload: Workload,
+    stats: Optional[Statistics] = None,
+    existing: Optional[Dict[str, List[Tuple[str, ...]]]] = None,
+    limit: Optional[int] = None,
+) -> List[IndexProposal]:
+    """
+    Propose indexes for a workload of queries, optionally weighted as `(query, weight)` pairs,
+    best first. Candidates already served by an `existing` index (keyed by table) or by a longer
+    candidate scoring at least as well are left out.
+    """
+    stats = stats or Statistics({})
+    accesses: List[_Access] = []
+    for n, item in enumerate(workload):
+        query, weight = item if isinstance(item, tuple) else (item, 1.0)
+        if not query.selection or not query.dataset:
+            raise ValueError("A query must have a selection and a dataset.")
+        accesses.extend(_accesses(query, n, weight, stats))
+
+    covered = {
+        (table.lower(), tuple(c.lower() for c in index[:k]))
+        for table, indexes in (existing or {}).items()
+        for index in indexes
+        for k in range(1, len(index) + 1)
+    }
+
+    proposals: Dict[Tuple[str, Tuple[str, ...]], IndexProposal] = {}
+    for a in accesses:
+        for columns in _candidates(a):
+            if (a.table, columns) in proposals or (a.table.lower(), columns) in covered:
+                continue
+            score, queries = 0.0, []
+            for other in accesses:
+                if other.table == a.table:
+                    benefit = other.benefit(columns)
+                    if benefit > 0:
+                        score += benefit
+                        queries.append(other.query)
+            if score > 0:
+                proposals[(a.table, columns)] = IndexProposal(
+                    a.table,
+                    tuple(a.names[c] for c in columns),
+                    score,
+                    sorted(set(queries)),
+                )
+
+    def subsumed(p: IndexProposal) -> bool:
+        cols = tuple(c.lower() for c in p.columns)
+        return any(
+            table == p.table
+            and len(other) > len(cols)
+            and other[: len(cols)] == cols
+            and q.score >= p.score
+            for (table, other), q in proposals.items()
+        )
+
+    ranked = sorted(
+        (p for p in proposals.values() if not subsumed(p)),
+        key=lambda p: (-p.score, p.table, p.columns),
+    )
+    return ranked[:limit] if limit is not None else ranked
+
+
+class Verification:
+    """
+    Plans and median run times of the queries a proposal is meant to help, before and after
+    creating the index.
+    """
+
+    def __init__(self, proposal: IndexProposal, before: List[Snapshot], after: List[Snapshot]):
+        self.proposal = proposal
+        self.before = before
+        self.after = after
+
+    @property
+    def used(self) -> bool:
+        """
+        Whether any plan reads through the new index.
+        """
+        return any(self.proposal.name in line for s in self.after for line in s.plan)
+
+    @property
+    def speedup(self) -> float:
+        after = sum(s.seconds for s in self.after)
+        return sum(s.seconds for s in self.before) / after if after else float("inf")
+
+    def __repr__(self) -> str:
+        return f"Verification({self.proposal}, used={self.used}, speedup={self.speedup:.2f})"
+
+
+def verify(
+    proposals: List[IndexProposal],
+    workload: Workload,
+    tables: List[Table],
+    backend=SQLiteBackend,
+    seed: int = 0,
+    repeat: int = 5,
+) -> List[Verification]:
+    """
+    Check each proposal on a freshly loaded local engine, comparing the plans and timings of the
+    queries it applies to before and after creating the index.
+    """
+    queries = [item[0] if isinstance(item, tuple) else item for item in workload]
+    results = []
+    for proposal in proposals:
+        engine: Backend = backend()
+        try:
+            engine.load(tables, seed)
+            sqls = [queries[n].to_string() for n in proposal.queries]
+            before = [measure(engine, sql, repeat) for sql in sqls]
+            engine.run(proposal.create_sql())
+            engine.run(f"analyze {proposal.table}")
+            after = [measure(engine, sql, repeat) for sql in sqls]
+        finally:
+            engine.close()
+        results.append(Verification(proposal, before, after))
+    return results
@@ -0,0 +1,270 @@
+import copy
+import re
+from typing import Any, Callable, Iterator, List, Optional, Set, Tuple
+
+from spork.expression import Expression
+from spork.func_expr import FuncExpr
+from spork.types import Op
+from spork.window import Window
+
+
+# A bare or dotted identifier, e.g. `Thing` or `fqr.Thing`
+IDENTIFIER = re.compile(r"^[A-Za-z_][\w$]*(\.[A-Za-z_][\w$]*)*$")
+
+# Identifiers embedded in free-form SQL text, e.g. the rhs of a `between`
+_EMBEDDED_IDENTIFIER = re.compile(
+    r"(?<![\w$.'])([A-Za-z_][\w$]*(?:\.(?:[A-Za-z_][\w$]*|\*))*)(?!\s*\()"
+)
+_QUOTED = re.compile(r"'(?:[^']|'')*'")
+_INT = re.compile(r"^[+-]?\d+$")
+_FLOAT = re.compile(r"^[+-]?(\d+\.\d*|\.\d+|\d+)([eE][+-]?\d+)?$")
+
+KEYWORDS = {
+    "and",
+    "or",
+    "not",
+    "is",
+    "null",
+    "true",
+    "false",
+    "between",
+    "in",
+    "like",
+    "as",
+    "case",
+    "when",
+    "then",
+    "else",
+    "end",
+    "distinct",
+    "over",
+    "partition",
+    "by",
+    "order",
+    "asc",
+    "desc",
+    "rows",
+    "unbounded",
+    "preceding",
+    "following",
+    "current",
+    "row",
+    "interval",
+}
+
+AGGREGATES = {"max", "min", "avg", "sum", "count", "median"}
+
+# A column reference: (qualifier, name), both lowercased. The qualifier is None for bare references.
+ColumnRef = Tuple[Optional[str], str]
+
+
+def is_identifier(s: str) -> bool:
+    return bool(IDENTIFIER.match(s)) and s.lower() not in KEYWORDS
+
+
+def is_leaf(exp: Expression) -> bool:
+    """
+    True if `exp` is a single value - a column or a literal - possibly wrapped in
+    `Expression(Expression(...))`, without operators, casts, negation or null checks.
+    """
+    while isinstance(exp, Expression) and not isinstance(exp, FuncExpr):
+        if exp.op is not None or exp.negate or exp.cast_to or exp.null_check:
+            return False
+        if not isinstance(exp.lhs, Expression):
+            return True
+        exp = exp.lhs
+    return False
+
+
+def leaf_text(exp: Expression) -> str:
+    """
+    The raw text of a leaf expression, see `is_leaf`.
+    """
+    while isinstance(exp.lhs, Expression):
+        exp = exp.lhs
+    return exp.lhs
+
+
+def parse_literal(text: str) -> Tuple[bool, Any]:
+    """
+    Parse the text of a literal leaf. Returns (is_literal, value); null parses as None.
+    """
+    lowered = text.strip().lower()
+    if lowered == "null":
+        return True, None
+    if lowered in ("true", "false"):
+        return True, lowered == "true"
+    if _INT.match(lowered):
+        return True, int(lowered)
+    if _FLOAT.match(lowered):
+        return True, float(lowered)
+    if len(text) >= 2 and text[0] == text[-1] == "'":
+        return True, text[1:-1].replace("''", "'")
+    return False, None
+
+
+def split_ref(s: str) -> ColumnRef:
+    """
+    Split a dotted identifier into (qualifier, name), e.g. `db.fqr.Thing` -> ("fqr", "thing").
+    """
+    parts = s.lower().split(".")
+    return (parts[-2] if len(parts) > 1 else None), parts[-1]
+
+
+def children(exp: Expression) -> Iterator[Any]:
+    """
+    Yield the direct operands of an expression: sub-expressions and raw strings.
+    """
+    if isinstance(exp, FuncExpr):
+        yield from (arg for arg in exp.args if arg is not None)
+        if exp.window:
+            for part in (exp.window.partitionby, exp.window.orderby):
+                if part is not None:
+                    yield part
+        return
+
+    yield exp.lhs
+    if exp.rhs is not None:
+        yield exp.rhs
+
+
+def column_refs(exp: Any) -> Set[ColumnRef]:
+    """
+    Collect every column referenced by an expression. Unparsed SQL text (such as the bounds of a
+    `between`) is scanned for identifiers, so the result may over- but never under-approximate.
+    """
+    refs: Set[ColumnRef] = set()
+    stack = [exp]
+    while stack:
+        e = stack.pop()
+        if isinstance(e, Expression):
+            stack.extend(children(e))
+        elif isinstance(e, str):
+            if e == "*":
+                refs.add((None, "*"))
+            elif is_identifier(e):
+                refs.add(split_ref(e))
+            else:
+                for token in _EMBEDDED_IDENTIFIER.findall(_QUOTED.sub("''", e)):
+                    if token.lower() not in KEYWORDS:
+                        refs.add(split_ref(token))
+    return refs
+
+
+def windows(exp: Any) -> List[Window]:
+    """
+    Collect the windows of every window function in an expression.
+    """
+    found = []
+    stack = [exp]
+    while stack:
+        e = stack.pop()
+        if isinstance(e, FuncExpr) and e.window:
+            found.append(e.window)
+        if isinstance(e, Expression):
+            stack.extend(children(e))
+    return found
+
+
+def transform(exp: Any, fn: Callable[[Any], Any]) -> Any:
+    """
+    Rebuild an expression top-down. `fn` is called with every node - expressions and raw
+    strings - and returns a replacement, or None to keep the node and descend into it. The
+    original expression is left untouched.
+    """
+    if not isinstance(exp, (Expression, str)):
+        return exp
+
+    replacement = fn(exp)
+    if replacement is not None:
+        return replacement
+    if isinstance(exp, str):
+        return exp
+
+    new = copy.copy(exp)
+    if isinstance(exp, FuncExpr):
+        new.args = [transform(arg, fn) for arg in exp.args]
+        if exp.window:
+            new.window = copy.copy(exp.window)
+            new.window.partitionby = transform(exp.window.partitionby, fn)
+            new.window.orderby = transform(exp.window.orderby, fn)
+        return new
+
+    new.lhs = transform(exp.lhs, fn)
+    if exp.bounds:
+        lower, upper = (transform(b, fn) for b in exp.bounds)
+        new.bounds = (lower, upper)
+        new.rhs = Expression(f"{lower.to_string()} and {upper.to_string()}")
+    elif exp.rhs is not None:
+        new.rhs = transform(exp.rhs, fn)
+    return new
+
+
+def conjuncts(exp: Optional[Expression]) -> List[Expression]:
+    """
+    Split an expression into its top-level `and` operands.
+    """
+    if exp is None:
+        return []
+    if (
+        exp.op == Op.AND
+        and not exp.negate
+        and not exp.cast_to
+        and not exp.null_check
+        and isinstance(exp.lhs, Expression)
+        and isinstance(exp.rhs, Expression)
+    ):
+        return conjuncts(exp.lhs) + conjuncts(exp.rhs)
+    return [exp]
+
+
+def is_aggregate(exp: Any) -> bool:
+    """
+    True if the expression contains an aggregate function outside of any window.
+    """
+    if not isinstance(exp, Expression):
+        return False
+    if isinstance(exp, FuncExpr) and exp.window is None and exp.f.value in AGGREGATES:
+        return True
+    return any(is_aggregate(c) for c in children(exp))
+
+
+def exp_str(exp: Expression) -> str:
+    """
+    Render an expression without its alias.
+    """
+    alias, exp._alias = exp._alias, None
+    try:
+        return exp.to_string()
+    finally:
+        exp._alias = alias
+
+
+def output_name(exp: Expression) -> Optional[str]:
+    """
+    The (lowercased) name a selected expression is exposed under, or None if it cannot be
+    determined from the expression alone.
+    """
+    if exp._alias:
+        return exp._alias.lower()
+    if is_leaf(exp) and is_identifier(leaf_text(exp)):
+        return split_ref(leaf_text(exp))[1]
+    return None
+
+
+def query_expressions(query, include_joins: bool = True) -> Iterator[Expression]:
+    """
+    Yield every top-level expression of a query: selection, join conditions, where, group by,
+    having, order by and qualify. Subqueries are not descended into.
+    """
+    if query.selection:
+        yield from query.selection.cols
+    if include_joins and query.dataset:
+        for join in query.dataset.joins:
+            yield join.on
+    for exp in (query._where, query._having, query._qualify):
+        if exp is not None:
+            yield exp
+    for exps in (query._group_by, query._order_by):
+        if exps:
+            yield from exps
@@ -0,0 +1,189 @@
+"""
+Approximate query mode: trade exactness for latency on exploratory queries.
+
+- The base entity of the dataset is read through a dialect-appropriate table sample. Joined
+  entities are read in full, as sampling both sides of a join compounds the sampling rate.
+- Exact aggregates are swapped for approximate ones where the dialect has them: `count(distinct)`
+  for `approx_count_distinct`, `median` for an approximate percentile (or an exact one, where the
+  dialect has no approximate percentile).
+- Counts and sums are scaled up by the sampling rate, and their standard errors are selected
+  alongside them.
+"""
+import copy
+from typing import List, Optional, Set, Tuple, Union
+
+from spork.analysis import AGGREGATES, transform
+from spork.dialect import Dialect, get_dialect
+from spork.expression import Expression
+from spork.func_expr import FuncExpr
+from spork.query import Query
+from spork.types import FuncLabel, Op
+
+
+class Estimate:
+    """
+    How one output column of an approximate query is computed, and how far off it may be.
+    """
+
+    EXACT = "exact"
+    SCALED = "scaled"
+    SKETCH = "sketch"
+    SAMPLED = "sampled"
+
+    def __init__(
+        self,
+        column: str,
+        method: str,
+        relative_error: Optional[float] = None,
+        stderr_column: Optional[str] = None,
+        notes: Optional[List[str]] = None,
+    ):
+        self.column = column
+        self.method = method
+        # Typical relative standard error, where known up front
+        self.relative_error = relative_error
+        # Output column holding the standard error, computed by the engine from the sample
+        self.stderr_column = stderr_column
+        self.notes = notes or []
+
+    def __repr__(self) -> str:
+        return f"Estimate({self.column}: {self.method})"
+
+
+class ApproxReport:
+    def __init__(self, fraction: Optional[float], dialect: Dialect, estimates: List[Estimate]):
+        self.fraction = fraction
+        self.dialect = dialect
+        self.estimates = estimates
+
+    def __repr__(self) -> str:
+        return f"ApproxReport(fraction={self.fraction}, dialect={self.dialect.name}, {self.estimates})"
+
+
+def _number(x: float) -> str:
+    return f"{x:.10g}"
+
+
+def approximate(
+    query: Query,
+    fraction: Optional[float] = None,
+    dialect: Union[str, Dialect] = "snowflake",
+    error_columns: bool = True,
+) -> Tuple[Query, ApproxReport]:
+    """
+    Return an approximate copy of `query`, reading a `fraction` (0-1] of the base entity's rows, and
+    a report of how each output column is estimated. Without a fraction, only the aggregates are
+    swapped for approximate ones.
+    """
+    dialect = get_dialect(dialect)
+    if fraction is not None and not 0 < fraction <= 1:
+        raise ValueError(f"Sampling fraction must be in (0, 1], got {fraction}.")
+    if not query.selection or not query.dataset:
+        raise ValueError("A query must have a selection and a dataset.")
+
+    sampled = fraction is not None and fraction < 1
+    query = copy.deepcopy(query)
+    if sampled:
+        if not dialect.sample:
+            raise ValueError(f"{dialect.name} does not support table sampling.")
+        query.dataset.entity.sample(
+            dialect.sample.format(percent=_number(fraction * 100)), dialect.sample_before_alias
+        )
+
+    def rewriter(kinds: Set[str]):
+        def fn(node):
+            if not (
+                isinstance(node, FuncExpr) and node.window is None and node.f.value in AGGREGATES
+            ):
+                return None
+
+            arg = node.args[0] if node.args else "*"
+            arg_sql = arg.to_string() if isinstance(arg, Expression) else str(arg)
+            if node.f == FuncLabel.COUNT and node.distinct:
+                kinds.add("distinct")
+                if dialect.approx_count_distinct:
+                    return Expression(dialect.approx_count_distinct.format(arg=arg_sql))
+                return None
+            if node.f == FuncLabel.MEDIAN:
+                kinds.add("percentile")
+                # `median` itself is not standard: fall back to the dialect's exact percentile
+                template = dialect.approx_percentile or dialect.percentile
+                if not template:
+                    raise ValueError(f"{dialect.name} has no percentile function.")
+                return Expression(template.format(arg=arg_sql, fraction="0.5", percent="50"))
+            if sampled and node.f in (FuncLabel.COUNT, FuncLabel.SUM):
+                kinds.add("scaled")
+                exact = copy.copy(node)
+                exact._alias = None
+                return Expression(lhs=exact, op=Op.MUL, rhs=Expression(_number(1 / fraction)))
+            if sampled:
+                kinds.add(node.f.value)
+            return None
+
+        return fn
+
+    cols, estimates = [], []
+    for exp in query.selection.cols:
+        kinds: Set[str] = set()
+        rewritten = transform(exp, rewriter(kinds))
+        rewritten._alias = exp._alias
+        cols.append(rewritten)
+
+        name = exp._alias or exp.to_string()
+        estimate = _estimate(name, kinds, sampled, dialect)
+        estimates.append(estimate)
+
+        stderr = _stderr(exp, fraction) if sampled and error_columns and kinds == {"scaled"} else None
+        if stderr is not None and exp._alias:
+            estimate.stderr_column = f"{exp._alias}_stderr"
+            cols.append(stderr.alias(estimate.stderr_column))
+        elif "scaled" in kinds:
+            estimate.notes.append("Standard error is only reported for aliased counts and sums.")
+    query.selection.cols = cols
+
+    ignored: Set[str] = set()
+    if query._having is not None:
+        query._having = transform(query._having, rewriter(ignored))
+    if query._order_by:
+        query._order_by = [transform(exp, rewriter(ignored)) for exp in query._order_by]
+
+    return query, ApproxReport(fraction if sampled else None, dialect, estimates)
+
+
+def _estimate(name: str, kinds: Set[str], sampled: bool, dialect: Dialect) -> Estimate:
+    notes = []
+    if "distinct" in kinds:
+        if sampled:
+            notes.append("Distinct counts over a sample are biased low and cannot be scaled.")
+        if not dialect.approx_count_distinct:
+            notes.append(f"{dialect.name} has no approximate distinct count; computed exactly.")
+        return Estimate(name, Estimate.SKETCH, dialect.count_distinct_error, notes=notes)
+    if "percentile" in kinds:
+        if not dialect.approx_percentile:
+            notes.append(f"{dialect.name} has no approximate percentile; computed exactly.")
+        return Estimate(name, Estimate.SKETCH, notes=notes)
+    if "scaled" in kinds:
+        return Estimate(name, Estimate.SCALED, notes=notes)
+    if "min" in kinds or "max" in kinds:
+        notes.append("Minimums and maximums over a sample are biased towards the center.")
+    if kinds:
+        return Estimate(name, Estimate.SAMPLED, notes=notes)
+
+    if sampled:
+        notes.append("Rare groups may be missing from the sample.")
+    return Estimate(name, Estimate.EXACT, notes=notes)
+
+
+def _stderr(exp: Expression, fraction: float) -> Optional[Expression]:
+    """
+    Standard error of a scaled count or sum under Bernoulli sampling with rate p, estimated from the
+    sample: sqrt((1 - p) * sum(x^2)) / p, where x is 1 for counts.
+    """
+    if not isinstance(exp, FuncExpr) or exp.f not in (FuncLabel.COUNT, FuncLabel.SUM):
+        return None
+
+    p = _number(fraction)
+    arg = exp.args[0] if exp.args else "*"
+    arg_sql = arg.to_string() if isinstance(arg, Expression) else str(arg)
+    squares = f"count({arg_sql})" if exp.f == FuncLabel.COUNT else f"sum({arg_sql} * {arg_sql})"
+    return Expression(f"sqrt((1 - {p}) * {squares}) / {p}")
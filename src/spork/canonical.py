@@ -0,0 +1,348 @@
+"""
+Canonical SQL rendering, so that equivalent queries produce identical text and hit warehouse
+result and plan caches, which match on exact query text.
+
+The canonical form:
+- sorts the operands of `and`, `or`, `=`, `<>`, `+` and `*`, and flattens `and`/`or` chains
+- turns `>` and `>=` into `<` and `<=`
+- renames table aliases to t0, t1, ... in order of appearance
+- sorts runs of consecutive inner joins, where their join conditions allow it
+- sorts group by expressions
+- renders every clause on one line, separated by single spaces
+- optionally lifts literals in where, join, having and qualify conditions into parameters
+"""
+import copy
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from spork.analysis import (
+    _QUOTED,
+    column_refs,
+    is_identifier,
+    parse_literal,
+)
+from spork.entity import Entity
+from spork.expression import Expression
+from spork.func_expr import FuncExpr
+from spork.query import Join, Query
+from spork.types import InclusionType, Op
+
+
+PARAMSTYLES = {
+    "qmark": "?",
+    "format": "%s",
+    "numeric": ":{n}",
+    "dollar": "${n}",
+}
+
+# Stands in for parameters until their final order is known
+_PARAM = "\x00"
+
+_COMMUTATIVE = {Op.EQ, Op.NEQ, Op.ADD, Op.MUL}
+_MIRRORED = {Op.GT: Op.LT, Op.GEQ: Op.LEQ}
+
+# Rendered text and the parameters it contains, in order
+Rendered = Tuple[str, List[Any]]
+
+
+class _Renderer:
+    def __init__(self, aliases: Dict[str, str], parametrize: bool):
+        self.aliases = aliases
+        self.parametrize = parametrize
+
+    def rename(self, text: str) -> str:
+        """
+        Rename alias qualifiers in a piece of SQL text, leaving quoted strings alone.
+        """
+        if not self.aliases:
+            return text
+
+        def qualifiers(part: str) -> str:
+            return re.sub(
+                r"(?<![\w$.])[A-Za-z_][\w$]*(?:\.(?:[A-Za-z_][\w$]*|\*))+",
+                lambda m: self.qualified(m.group(0)),
+                part,
+            )
+
+        out, last = [], 0
+        for m in _QUOTED.finditer(text):
+            out.append(qualifiers(text[last : m.start()]))
+            out.append(m.group(0))
+            last = m.end()
+        out.append(qualifiers(text[last:]))
+        return "".join(out)
+
+    def qualified(self, ref: str) -> str:
+        """
+        Rename the table qualifier of a dotted column reference. The schema of a renamed qualifier
+        is dropped, as the new alias stands for the schema-qualified table.
+        """
+        qualifier, _, name = ref.rpartition(".")
+        last = qualifier.rpartition(".")[2].lower()
+        return f"{self.aliases[last]}.{name}" if last in self.aliases else ref
+
+    def leaf(self, text: str, lift: bool) -> Rendered:
+        is_literal, value = parse_literal(text)
+        if is_literal:
+            if lift and value is not None:
+                return _PARAM, [value]
+            return text, []
+        if is_identifier(text) and "." in text:
+            return self.qualified(text), []
+        return self.rename(text), []
+
+    def operands(self, exp: Expression, op: Op) -> List[Any]:
+        plain = not (exp.negate or exp.cast_to or exp.null_check or exp._alias)
+        if (
+            exp.op == op
+            and plain
+            and isinstance(exp.lhs, Expression)
+            and isinstance(exp.rhs, Expression)
+        ):
+            return self.operands(exp.lhs, op) + self.operands(exp.rhs, op)
+        return [exp]
+
+    def exp(self, exp: Any, lift: bool = False) -> Rendered:
+        if not isinstance(exp, Expression):
+            return self.leaf(str(exp), lift)
+        if isinstance(exp, FuncExpr):
+            return self.func(exp, lift)
+
+        params: List[Any] = []
+        if exp.op is None:
+            text, params = self.exp(exp.lhs, lift)
+        elif exp.op in (Op.AND, Op.OR):
+            parts = sorted((self.exp(o, lift) for o in self.operands(exp, exp.op)), key=_text)
+            text = "(" + f" {exp.op.value} ".join(t for t, _ in parts) + ")"
+            params = [p for _, ps in parts for p in ps]
+        elif exp.op == Op.BETWEEN:
+            value = self.exp(exp.lhs, lift)
+            if exp.bounds:
+                lower, upper = (self.exp(b, lift) for b in exp.bounds)
+                text = f"({value[0]} between {lower[0]} and {upper[0]})"
+                params = value[1] + lower[1] + upper[1]
+            else:
+                bounds = self.exp(exp.rhs, False)
+                text = f"({value[0]} between {bounds[0]})"
+                params = value[1]
+        else:
+            op, lhs, rhs = exp.op, exp.lhs, exp.rhs
+            if op in _MIRRORED:
+                op, lhs, rhs = _MIRRORED[op], rhs, lhs
+            parts = [self.exp(lhs, lift), self.exp(rhs, lift)]
+            if op in _COMMUTATIVE:
+                parts.sort(key=_text)
+            text = f"({parts[0][0]} {op.value} {parts[1][0]})"
+            params = parts[0][1] + parts[1][1]
+
+        # Mirrors Expression.to_string
+        if exp.negate:
+            text = f"not {text}"
+        if exp.cast_to is not None:
+            text += f"::{exp.cast_to.lower()}"
+        if exp._alias:
+            text += f" as {exp._alias}"
+        if exp.null_check:
+            text += " " + exp.null_check.value
+        return text, params
+
+    def func(self, f: FuncExpr, lift: bool) -> Rendered:
+        args = [self.exp(arg, lift) for arg in f.args if arg is not None]
+        params = [p for _, ps in args for p in ps]
+        text = ", ".join(t for t, _ in args)
+        if f.distinct:
+            text = f"distinct {text}"
+        text = f"{f.f.value}({text})"
+
+        if f.window:
+            w = f.window
+            parts = []
+            if w.partitionby is not None:
+                parts.append(f"partition by {self.exp(w.partitionby)[0]}")
+            if w.orderby is not None:
+                order = f"order by {self.exp(w.orderby)[0]}"
+                if w.ordering:
+                    order += f" {w.ordering.value}"
+                parts.append(order)
+            parts.append(
+                f"rows between {w.rowsbetween_lhs.to_string()} and {w.rowsbetween_rhs.to_string()}"
+            )
+            text += f" over ({' '.join(parts)})"
+        if f._alias:
+            text += f" as {f._alias}"
+        return text, params
+
+    def condition(self, exp: Expression) -> Rendered:
+        text, params = self.exp(exp, self.parametrize)
+        # Drop the parentheses around a whole condition
+        if (
+            exp.op is not None
+            and not (exp.negate or exp.cast_to or exp.null_check)
+            and text.startswith("(")
+            and text.endswith(")")
+        ):
+            text = text[1:-1]
+        return text, params
+
+
+def _text(rendered: Rendered) -> str:
+    """
+    Sort key of rendered operands: parameters may be of types that do not compare.
+    """
+    return rendered[0]
+
+
+def _source_key(what) -> str:
+    if isinstance(what, Entity):
+        return f"{what.ref.lower()} {what._sample or ''}"
+    return what.to_string() if isinstance(what, (Query, Expression)) else str(what)
+
+
+def _source_alias(what) -> Optional[str]:
+    if isinstance(what, Entity):
+        return (what._alias or what.ref.split(".")[-1]).lower()
+    if isinstance(what, Query):
+        return what._alias.lower() or None
+    return None
+
+
+def _order_joins(base: Entity, joins: List[Join]) -> List[Join]:
+    """
+    Sort each run of consecutive inner joins, keeping every join after the ones it references.
+    """
+    ordered: List[Join] = []
+    available = {_source_alias(base)}
+    i = 0
+    while i < len(joins):
+        if joins[i].how != InclusionType.INNER:
+            ordered.append(joins[i])
+            available.add(_source_alias(joins[i].what))
+            i += 1
+            continue
+
+        run = []
+        while i < len(joins) and joins[i].how == InclusionType.INNER:
+            run.append(joins[i])
+            i += 1
+
+        run_aliases = {_source_alias(j.what) for j in run}
+        deps = []
+        for j in run:
+            refs = column_refs(j.on)
+            if any(q is None for q, _ in refs) or None in run_aliases:
+                # Bare columns could come from anywhere: keep the run as written
+                deps = None
+                break
+            deps.append({q for q, _ in refs} & run_aliases - {_source_alias(j.what)})
+
+        if deps is None:
+            ordered.extend(run)
+            available |= run_aliases
+            continue
+
+        pending = list(zip(run, deps))
+        while pending:
+            ready = [(j, d) for j, d in pending if d <= available]
+            if not ready:
+                # Circular references: keep the remainder as written
+                ordered.extend(j for j, _ in pending)
+                available |= {_source_alias(j.what) for j, _ in pending}
+                break
+            j, d = min(ready, key=lambda jd: _source_key(jd[0].what))
+            ordered.append(j)
+            available.add(_source_alias(j.what))
+            pending.remove((j, d))
+    return ordered
+
+
+def _render_query(query: Query, parametrize: bool) -> Rendered:
+    if not query.selection:
+        raise ValueError("A query must have a selection.")
+    if not query.dataset:
+        raise ValueError("A query must have a dataset.")
+
+    base = query.dataset.entity
+    joins = _order_joins(base, query.dataset.joins)
+
+    # Entities without an alias are referred to by the last part of their ref
+    aliases: Dict[str, str] = {}
+    for n, what in enumerate([base] + [j.what for j in joins]):
+        alias = _source_alias(what)
+        if alias is not None:
+            aliases[alias] = f"t{n}"
+    r = _Renderer(aliases, parametrize)
+
+    params: List[Any] = []
+
+    def add(rendered: Rendered) -> str:
+        params.extend(rendered[1])
+        return rendered[0]
+
+    cols = ", ".join(add(r.exp(c)) for c in query.selection.cols)
+    parts = [f"select {cols}", f"from {_entity(base, aliases)}"]
+
+    for n, join in enumerate(joins, start=1):
+        if isinstance(join.what, Query):
+            what = f"({add(_render_query(join.what, parametrize))}) t{n}"
+        elif isinstance(join.what, Entity):
+            what = _entity(join.what, aliases)
+        else:
+            what = add(r.exp(join.what))
+        parts.append(f"{join.how.value} join {what} on {add(r.condition(join.on))}")
+
+    if query._where is not None:
+        parts.append(f"where {add(r.condition(query._where))}")
+    if query._group_by:
+        group_by = sorted((r.exp(e) for e in query._group_by), key=_text)
+        parts.append("group by " + ", ".join(add(g) for g in group_by))
+    if query._having is not None:
+        parts.append(f"having {add(r.condition(query._having))}")
+    if query._qualify is not None:
+        parts.append(f"qualify {add(r.condition(query._qualify))}")
+    if query._order_by:
+        keys = []
+        for e in query._order_by:
+            key = add(r.exp(e))
+            for o in (e.ordering, e.ordering_nulls):
+                if o:
+                    key += f" {o.value}"
+            keys.append(key)
+        parts.append("order by " + ", ".join(keys))
+
+    return " ".join(parts), params
+
+
+def _entity(entity: Entity, aliases: Dict[str, str]) -> str:
+    renamed = copy.copy(entity)
+    renamed._alias = aliases[_source_alias(entity)]
+    return renamed.to_string()
+
+
+def _placeholders(text: str, paramstyle: str) -> str:
+    template = PARAMSTYLES.get(paramstyle)
+    if template is None:
+        raise ValueError(f"Unknown paramstyle: {paramstyle}")
+    pieces = text.split(_PARAM)
+    out = [pieces[0]]
+    for n, piece in enumerate(pieces[1:], start=1):
+        out.append(template.format(n=n))
+        out.append(piece)
+    return "".join(out)
+
+
+def canonicalize(
+    query: Query, parametrize: bool = False, paramstyle: str = "qmark"
+) -> Tuple[str, List[Any]]:
+    """
+    Render `query` canonically. Returns the SQL text and, when `parametrize` is set, the values of
+    the literals lifted out of its conditions, in placeholder order.
+    """
+    text, params = _render_query(query, parametrize)
+    return _placeholders(text, paramstyle), params
+
+
+def canonical_expression(exp: Expression) -> str:
+    """
+    Render an expression canonically. Table aliases are left as they are.
+    """
+    return _Renderer({}, False).exp(exp)[0]
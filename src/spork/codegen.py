@@ -0,0 +1,244 @@
+"""
+Compile expressions to Python functions over single records, with SQL three-valued logic: None is
+NULL, comparisons and arithmetic involving NULL yield NULL, and `and`/`or` follow Kleene logic.
+"""
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Optional, Sequence
+
+from spork.analysis import is_identifier, parse_literal, split_ref
+from spork.expression import Expression
+from spork.func_expr import FuncExpr
+from spork.types import NullCheck, Op
+
+
+_COMPARISONS = {
+    Op.EQ: "==",
+    Op.NEQ: "!=",
+    Op.LT: "<",
+    Op.LEQ: "<=",
+    Op.GT: ">",
+    Op.GEQ: ">=",
+    Op.ADD: "+",
+    Op.SUB: "-",
+    Op.MUL: "*",
+}
+
+
+def _div(a, b):
+    if b == 0:
+        return None
+    if isinstance(a, int) and isinstance(b, int):
+        # SQL integer division truncates towards zero
+        q = abs(a) // abs(b)
+        return q if (a < 0) == (b < 0) else -q
+    return a / b
+
+
+def _mod(a, b):
+    if b == 0:
+        return None
+    if isinstance(a, int) and isinstance(b, int):
+        # The sign of the result follows the dividend
+        r = abs(a) % abs(b)
+        return r if a >= 0 else -r
+    return a - b * int(a / b)
+
+
+def _to_int(v):
+    if v is None:
+        return None
+    if isinstance(v, float):
+        return int(v + (0.5 if v >= 0 else -0.5))
+    return int(v)
+
+
+def _to_float(v):
+    return None if v is None else float(v)
+
+
+def _to_str(v):
+    if v is None:
+        return None
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    return str(v)
+
+
+def _to_bool(v):
+    if v is None:
+        return None
+    if isinstance(v, str):
+        return v.strip().lower() in ("true", "t", "1")
+    return bool(v)
+
+
+def _to_timestamp(v):
+    return datetime.fromisoformat(v) if isinstance(v, str) else v
+
+
+def _to_date(v):
+    if isinstance(v, str):
+        return date.fromisoformat(v[:10])
+    return v.date() if isinstance(v, datetime) else v
+
+
+_CASTS = {
+    "int": "_to_int",
+    "integer": "_to_int",
+    "bigint": "_to_int",
+    "smallint": "_to_int",
+    "tinyint": "_to_int",
+    "float": "_to_float",
+    "double": "_to_float",
+    "real": "_to_float",
+    "decimal": "_to_float",
+    "numeric": "_to_float",
+    "number": "_to_float",
+    "text": "_to_str",
+    "varchar": "_to_str",
+    "string": "_to_str",
+    "char": "_to_str",
+    "boolean": "_to_bool",
+    "bool": "_to_bool",
+    "timestamp": "_to_timestamp",
+    "datetime": "_to_timestamp",
+    "date": "_to_date",
+}
+
+_NAMESPACE = {
+    "_div": _div,
+    "_mod": _mod,
+    "_to_int": _to_int,
+    "_to_float": _to_float,
+    "_to_str": _to_str,
+    "_to_bool": _to_bool,
+    "_to_timestamp": _to_timestamp,
+    "_to_date": _to_date,
+}
+
+
+class _Compiler:
+    def __init__(self, columns: Optional[Sequence[str]]):
+        self.positions: Optional[Dict[str, int]] = (
+            {c.lower().split(".")[-1]: i for i, c in enumerate(columns)}
+            if columns is not None
+            else None
+        )
+        self.temps = 0
+        # Generated code of non-null literals, which need no null checks
+        self.constants = set()
+
+    def temp(self) -> str:
+        self.temps += 1
+        return f"_t{self.temps}"
+
+    def compile(self, exp: Any) -> str:
+        if not isinstance(exp, Expression):
+            return self.leaf(str(exp))
+        if isinstance(exp, FuncExpr):
+            raise NotImplementedError(f"Cannot compile function {exp.to_string()} per record.")
+
+        if exp.op is None:
+            code = self.compile(exp.lhs)
+        elif exp.op == Op.BETWEEN:
+            if exp.bounds is None:
+                raise NotImplementedError("Cannot compile an unstructured between.")
+            # Bound once, before either comparison, since a null bound folds its comparison away
+            value = self.temp()
+            lower = self.binary(">=", value, self.compile(exp.bounds[0]))
+            upper = self.binary("<=", value, self.compile(exp.bounds[1]))
+            code = (
+                f"(None if ({value} := {self.compile(exp.lhs)}) is None "
+                f"else {self.logical(Op.AND, lower, upper)})"
+            )
+        elif exp.op in (Op.AND, Op.OR):
+            code = self.logical(exp.op, self.compile(exp.lhs), self.compile(exp.rhs))
+        elif exp.op in (Op.DIV, Op.MOD):
+            f = "_div" if exp.op == Op.DIV else "_mod"
+            code = self.binary(None, self.compile(exp.lhs), self.compile(exp.rhs), f)
+        else:
+            code = self.binary(_COMPARISONS[exp.op], self.compile(exp.lhs), self.compile(exp.rhs))
+
+        # SQL precedence: cast binds tightest, then `is [not] null`, then `not`
+        if exp.cast_to:
+            cast = _CASTS.get(exp.cast_to.lower().split("(")[0].strip())
+            if cast is None:
+                raise NotImplementedError(f"Unsupported cast: {exp.cast_to}")
+            code = f"{cast}({code})"
+        if exp.null_check:
+            code = f"({code} is {'' if exp.null_check == NullCheck.IS_NULL else 'not '}None)"
+        if exp.negate:
+            t = self.temp()
+            code = f"(None if ({t} := {code}) is None else not {t})"
+        return code
+
+    def leaf(self, text: str) -> str:
+        is_literal, value = parse_literal(text)
+        if is_literal:
+            if value is not None:
+                self.constants.add(repr(value))
+            return repr(value)
+        if not is_identifier(text):
+            raise ValueError(f"Cannot compile {text!r}")
+
+        name = split_ref(text)[1]
+        if self.positions is None:
+            return f"row.get({text.split('.')[-1]!r})"
+        if name not in self.positions:
+            raise ValueError(f"Unknown column: {text}")
+        return f"row[{self.positions[name]}]"
+
+    def binary(self, op: Optional[str], lhs: str, rhs: str, f: Optional[str] = None) -> str:
+        """
+        `lhs op rhs`, or `f(lhs, rhs)`, unless either operand is null.
+        """
+        if "None" in (lhs, rhs):
+            return "None"
+
+        checks, operands = [], []
+        for code in (lhs, rhs):
+            if code in self.constants:
+                operands.append(code)
+            else:
+                t = self.temp()
+                checks.append(f"({t} := {code}) is None")
+                operands.append(t)
+
+        a, b = operands
+        result = f"{f}({a}, {b})" if f else f"({a} {op} {b})"
+        if not checks:
+            return result
+        return f"(None if {' or '.join(checks)} else {result})"
+
+    def logical(self, op: Op, lhs: str, rhs: str) -> str:
+        a, b = self.temp(), self.temp()
+        # An operand that is false decides an `and`, one that is true decides an `or`
+        if op == Op.AND:
+            decides, decided, otherwise = "not ", "False", "True"
+        else:
+            decides, decided, otherwise = "", "True", "False"
+        return (
+            f"({decided} if (({a} := {lhs}) is not None and {decides}{a}) "
+            f"or (({b} := {rhs}) is not None and {decides}{b}) "
+            f"else (None if {a} is None or {b} is None else {otherwise}))"
+        )
+
+
+def compile_expression(
+    exp: Expression, columns: Optional[Sequence[str]] = None
+) -> Callable[[Any], Any]:
+    """
+    Generate a single Python function evaluating `exp` for one record.
+
+    Records are dicts keyed by unqualified column name, or - when `columns` is given - tuples
+    laid out as `columns`. The function returns True, False or None (NULL), so it can be passed
+    straight to `filter`.
+    """
+    code = _Compiler(columns).compile(exp)
+    source = f"def predicate(row):\n    return {code}\n"
+
+    namespace = dict(_NAMESPACE)
+    exec(compile(source, f"<spork: {exp.to_string()}>", "exec"), namespace)
+    predicate = namespace["predicate"]
+    predicate.source = source
+    return predicate
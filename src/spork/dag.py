@@ -0,0 +1,321 @@
+"""
+Running graphs of dependent queries.
+
+A pipeline is a set of named queries. A query depends on another when it joins that query's
+`Query` object, or reads an `Entity` whose ref is the other query's output table. Queries run in
+parallel as soon as the queries they depend on are done, and every node is materialized at most
+once:
+
+- a node with an `output` table is written to it, and is skipped when neither its SQL nor any of
+  its inputs changed since the last run,
+- a node other nodes depend on is materialized as a temporary table, which its dependents read
+  instead of inlining the query,
+- any other node is a result: it is run, and its result returned.
+
+Temporary tables are only visible to the session that created them, so with the default template
+`executor` has to run every statement on the same session.
+"""
+import copy
+import hashlib
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from spork.entity import Entity
+from spork.query import Dataset, Join, Query
+
+
+TEMPORARY = "create temporary table {name} as {sql}"
+PERSISTENT = "create or replace table {name} as {sql}"
+DROP = "drop table if exists {name}"
+
+
+class Node:
+    def __init__(self, name: str, query: Query, output: Optional[str] = None):
+        self.name = name
+        self.query = query
+        self.output = output
+
+    @property
+    def table(self) -> str:
+        """
+        The table the node is materialized into.
+        """
+        return self.output or re.sub(r"\W", "_", f"tmp_{self.name}")
+
+    def __repr__(self) -> str:
+        return f"Node({self.name})"
+
+
+class RunReport:
+    def __init__(
+        self,
+        results: Dict[str, Any],
+        seconds: Dict[str, float],
+        skipped: List[str],
+        critical_path: List[str],
+        fingerprints: Dict[str, str],
+    ):
+        self.results = results
+        # Run time of every node that ran
+        self.seconds = seconds
+        self.skipped = skipped
+        # The chain of dependent nodes that took the longest, first to last
+        self.critical_path = critical_path
+        # To pass as `state` to the next run
+        self.fingerprints = fingerprints
+
+    @property
+    def critical_seconds(self) -> float:
+        return sum(self.seconds.get(name, 0.0) for name in self.critical_path)
+
+    def __repr__(self) -> str:
+        return (
+            f"RunReport(ran={sorted(self.seconds)}, skipped={self.skipped}, "
+            f"critical_path={self.critical_path})"
+        )
+
+
+class Pipeline:
+    """
+    Statements are rendered from the `temporary`, `persistent` and `drop` templates, which take the
+    table `name` and, but for `drop`, the query `sql`.
+    """
+
+    def __init__(
+        self,
+        temporary: str = TEMPORARY,
+        persistent: str = PERSISTENT,
+        drop: str = DROP,
+    ):
+        self.temporary = temporary
+        self.persistent = persistent
+        self.drop = drop
+        self.nodes: Dict[str, Node] = {}
+
+    def add(self, name: str, query: Query, output: Optional[str] = None) -> Query:
+        """
+        Add a query, optionally written to the `output` table. Returns the query, to be joined by
+        queries added later.
+        """
+        if name in self.nodes:
+            raise ValueError(f"Duplicate node: {name}")
+        self.nodes[name] = Node(name, query, output)
+        return query
+
+    def _by_query(self) -> Dict[int, Node]:
+        return {id(node.query): node for node in self.nodes.values()}
+
+    def _by_table(self) -> Dict[str, Node]:
+        return {node.table.lower(): node for node in self.nodes.values()}
+
+    def dependencies(self) -> Dict[str, Set[str]]:
+        """
+        The names of the nodes each node depends on.
+        """
+        by_query, by_table = self._by_query(), self._by_table()
+
+        def visit(query: Query, deps: Set[str]):
+            if not query.dataset:
+                return
+            for what in [query.dataset.entity] + [j.what for j in query.dataset.joins]:
+                if isinstance(what, Query):
+                    if id(what) in by_query:
+                        deps.add(by_query[id(what)].name)
+                    else:
+                        visit(what, deps)
+                elif isinstance(what, Entity) and what.ref.lower() in by_table:
+                    deps.add(by_table[what.ref.lower()].name)
+
+        edges = {}
+        for node in self.nodes.values():
+            deps: Set[str] = set()
+            visit(node.query, deps)
+            deps.discard(node.name)
+            edges[node.name] = deps
+        return edges
+
+    def order(self) -> List[str]:
+        """
+        The nodes in an order where every node comes after the nodes it depends on.
+        """
+        edges = self.dependencies()
+        ordered: List[str] = []
+        done: Set[str] = set()
+        visiting: Set[str] = set()
+
+        def visit(name: str):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle through {name}")
+            visiting.add(name)
+            for dep in sorted(edges[name]):
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+            ordered.append(name)
+
+        for name in self.nodes:
+            visit(name)
+        return ordered
+
+    def sql(self, name: str) -> str:
+        """
+        The query of a node, reading the tables of the nodes it joins rather than inlining them.
+        """
+        by_query = self._by_query()
+
+        def rewrite(query: Query) -> Query:
+            if not query.dataset:
+                return query
+            joins = []
+            for join in query.dataset.joins:
+                what = join.what
+                if isinstance(what, Query):
+                    node = by_query.get(id(what))
+                    what = Entity(node.table).alias(what._alias) if node else rewrite(what)
+                joins.append(Join(what, join.on, join.how))
+            new = copy.copy(query)
+            new.dataset = Dataset(query.dataset.entity, *joins)
+            return new
+
+        return rewrite(self.nodes[name].query).to_string()
+
+    def _fingerprints(self, order: List[str], versions: Dict[str, Any]) -> Dict[str, str]:
+        """
+        A hash of each node's SQL, the fingerprints of the nodes it depends on and the versions of
+        the other tables it reads.
+        """
+        edges = self.dependencies()
+        fingerprints: Dict[str, str] = {}
+        for name in order:
+            h = hashlib.sha256(self.sql(name).encode())
+            for dep in sorted(edges[name]):
+                h.update(fingerprints[dep].encode())
+            for table in sorted(_tables(self.nodes[name].query)):
+                if table in versions:
+                    h.update(f"{table}={versions[table]!r}".encode())
+            fingerprints[name] = h.hexdigest()
+        return fingerprints
+
+    def run(
+        self,
+        executor: Callable[[str, Any], Any],
+        workers: int = 4,
+        state: Optional[Dict[str, str]] = None,
+        versions: Optional[Dict[str, Any]] = None,
+        cleanup: bool = True,
+    ) -> RunReport:
+        """
+        Run the pipeline through `executor(sql, params)`.
+
+        `state` holds the fingerprints of the previous run, and `versions` a version of each table
+        read from outside the pipeline (e.g. a last modified time), keyed by lowercased ref.
+        Output nodes whose fingerprint did not change are skipped, as are temporary tables that no
+        node running needs.
+        """
+        state = state or {}
+        versions = {k.lower(): v for k, v in (versions or {}).items()}
+        order = self.order()
+        edges = self.dependencies()
+        dependents: Dict[str, Set[str]] = {name: set() for name in order}
+        for name, deps in edges.items():
+            for dep in deps:
+                dependents[dep].add(name)
+
+        fingerprints = self._fingerprints(order, versions)
+        needed: Set[str] = set()
+        for name in reversed(order):
+            node = self.nodes[name]
+            if node.output:
+                if state.get(name) != fingerprints[name]:
+                    needed.add(name)
+            elif not dependents[name] or dependents[name] & needed:
+                needed.add(name)
+
+        results: Dict[str, Any] = {}
+        seconds: Dict[str, float] = {}
+        temporary: List[str] = []
+
+        def execute(name: str) -> float:
+            node = self.nodes[name]
+            sql = self.sql(name)
+            start = time.perf_counter()
+            if node.output:
+                executor(self.persistent.format(name=node.table, sql=sql), None)
+            elif dependents[name]:
+                executor(self.temporary.format(name=node.table, sql=sql), None)
+            else:
+                results[name] = executor(sql, None)
+            return time.perf_counter() - start
+
+        pending = [name for name in order if name in needed]
+        done = {name for name in order if name not in needed}
+        running: Dict[Future, str] = {}
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                while pending or running:
+                    for name in [n for n in pending if edges[n] <= done]:
+                        pending.remove(name)
+                        # Registered before it runs, so that a create failing halfway is dropped too
+                        if not self.nodes[name].output and dependents[name]:
+                            temporary.append(name)
+                        running[pool.submit(execute, name)] = name
+                    finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        name = running.pop(future)
+                        # Raises the first error, once the running nodes are done
+                        seconds[name] = future.result()
+                        done.add(name)
+        finally:
+            if cleanup:
+                for name in temporary:
+                    executor(self.drop.format(name=self.nodes[name].table), None)
+
+        written = {n: fingerprints[n] for n in seconds if self.nodes[n].output}
+        return RunReport(
+            results,
+            seconds,
+            [name for name in order if name not in needed],
+            _critical_path(order, edges, seconds),
+            {**state, **written},
+        )
+
+
+def _tables(query: Query) -> Set[str]:
+    """
+    Lowercased refs of every entity a query reads, including through subqueries.
+    """
+    tables: Set[str] = set()
+    if query.dataset:
+        for what in [query.dataset.entity] + [j.what for j in query.dataset.joins]:
+            if isinstance(what, Entity):
+                tables.add(what.ref.lower())
+            elif isinstance(what, Query):
+                tables |= _tables(what)
+    return tables
+
+
+def _critical_path(
+    order: List[str], edges: Dict[str, Set[str]], seconds: Dict[str, float]
+) -> List[str]:
+    """
+    The chain of dependent nodes with the longest total run time.
+    """
+    finish: Dict[str, float] = {}
+    previous: Dict[str, Optional[str]] = {}
+    for name in order:
+        before = max(edges[name], key=lambda d: finish[d], default=None)
+        previous[name] = before
+        finish[name] = (finish[before] if before else 0.0) + seconds.get(name, 0.0)
+
+    if not finish:
+        return []
+    path: List[str] = []
+    name: Optional[str] = max(order, key=lambda n: finish[n])
+    while name is not None:
+        path.append(name)
+        name = previous[name]
+    return path[::-1]
@@ -0,0 +1,112 @@
+from typing import Dict, Optional, Union
+
+
+class Dialect:
+    """
+    The syntax and capabilities of a SQL engine, where these differ between engines.
+
+    Templates are `str.format` strings:
+    - `sample` takes `percent`
+    - `approx_count_distinct` takes `arg`
+    - `approx_percentile` and `percentile` (exact) take `arg`, `fraction` (0-1) and `percent`
+      (0-100)
+
+    Limits on a single statement are None where the engine has none worth planning for. `upsert` is
+    "on conflict" for engines with `insert ... on conflict`, and "merge" for the others.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        sample: Optional[str] = None,
+        sample_before_alias: bool = False,
+        approx_count_distinct: Optional[str] = None,
+        approx_percentile: Optional[str] = None,
+        percentile: Optional[str] = None,
+        count_distinct_error: Optional[float] = None,
+        paramstyle: str = "qmark",
+        max_params: Optional[int] = None,
+        max_rows: Optional[int] = None,
+        max_statement_bytes: Optional[int] = None,
+        upsert: str = "merge",
+    ):
+        self.name = name
+        self.sample = sample
+        self.sample_before_alias = sample_before_alias
+        self.approx_count_distinct = approx_count_distinct
+        self.approx_percentile = approx_percentile
+        self.percentile = percentile
+        # Typical relative standard error of approx_count_distinct, where documented
+        self.count_distinct_error = count_distinct_error
+        self.paramstyle = paramstyle
+        self.max_params = max_params
+        self.max_rows = max_rows
+        self.max_statement_bytes = max_statement_bytes
+        self.upsert = upsert
+
+
+DIALECTS: Dict[str, Dialect] = {
+    d.name: d
+    for d in [
+        Dialect(
+            "snowflake",
+            sample="sample bernoulli ({percent})",
+            approx_count_distinct="approx_count_distinct({arg})",
+            approx_percentile="approx_percentile({arg}, {fraction})",
+            percentile="percentile_cont({fraction}) within group (order by {arg})",
+            count_distinct_error=0.0162,
+            paramstyle="format",
+            max_rows=16384,
+            max_statement_bytes=1024 * 1024,
+        ),
+        Dialect(
+            "postgres",
+            sample="tablesample bernoulli ({percent})",
+            percentile="percentile_cont({fraction}) within group (order by {arg})",
+            paramstyle="format",
+            max_params=65535,
+            upsert="on conflict",
+        ),
+        Dialect(
+            "bigquery",
+            sample="tablesample system ({percent} percent)",
+            approx_count_distinct="approx_count_distinct({arg})",
+            approx_percentile="approx_quantiles({arg}, 100)[offset({percent})]",
+            paramstyle="format",
+            max_params=10000,
+            max_statement_bytes=1024 * 1024,
+        ),
+        Dialect(
+            "duckdb",
+            sample="tablesample {percent}% (bernoulli)",
+            approx_count_distinct="approx_count_distinct({arg})",
+            approx_percentile="approx_quantile({arg}, {fraction})",
+            percentile="quantile_cont({arg}, {fraction})",
+            upsert="on conflict",
+        ),
+        Dialect(
+            "spark",
+            sample="tablesample ({percent} percent)",
+            sample_before_alias=True,
+            approx_count_distinct="approx_count_distinct({arg})",
+            approx_percentile="percentile_approx({arg}, {fraction})",
+            percentile="percentile({arg}, {fraction})",
+            count_distinct_error=0.05,
+        ),
+        Dialect(
+            "sqlite",
+            max_params=32766,
+            max_statement_bytes=1000000000,
+            upsert="on conflict",
+        ),
+    ]
+}
+
+
+def get_dialect(dialect: Union[str, Dialect]) -> Dialect:
+    if isinstance(dialect, Dialect):
+        return dialect
+    try:
+        return DIALECTS[dialect.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown dialect: {dialect}")
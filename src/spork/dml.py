@@ -0,0 +1,341 @@
+"""
+Bulk loading: insert, upsert and merge statements over many rows, chunked to fit the limits of the
+target dialect.
+
+Rows come from any iterable of tuples or dicts, or from columns (e.g. numpy arrays), and are
+consumed lazily, one chunk at a time. Each chunk is either one multi-row statement (`batches`), or
+a single-row statement with a list of parameter rows for `executemany` (`parameter_batches`).
+"""
+import datetime
+import decimal
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator, List, Mapping, Optional, Sequence, Union
+
+from spork.canonical import PARAMSTYLES
+from spork.dialect import Dialect, get_dialect
+from spork.entity import Entity
+
+
+# Rows per statement when the dialect sets no tighter limit
+DEFAULT_BATCH_ROWS = 1000
+
+
+class Batch:
+    """
+    One statement and its parameters. For `executemany` batches, `params` holds one sequence of
+    parameters per row.
+    """
+
+    def __init__(self, sql: str, params: List[Any], rows: int, many: bool = False):
+        self.sql = sql
+        self.params = params
+        self.rows = rows
+        self.many = many
+
+    def __repr__(self) -> str:
+        return f"Batch({self.rows} rows, {len(self.sql)} bytes)"
+
+
+def literal(value: Any) -> str:
+    """
+    Render a Python value as a SQL literal.
+    """
+    value = _python(value)
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float, decimal.Decimal)):
+        return repr(value) if isinstance(value, float) else str(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        value = value.isoformat()
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    raise TypeError(f"Cannot render {type(value).__name__} as a SQL literal.")
+
+
+def _python(value: Any) -> Any:
+    """
+    Unwrap numpy scalars, which database drivers generally do not accept.
+    """
+    if hasattr(value, "item") and not isinstance(value, (str, bytes)):
+        return value.item()
+    return value
+
+
+def rows_from_columns(columns: Mapping[str, Sequence[Any]], names: Sequence[str]) -> Iterator[tuple]:
+    """
+    Rows of `columns`, laid out as `names`.
+    """
+    missing = [n for n in names if n not in columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    lengths = {len(columns[n]) for n in names}
+    if len(lengths) > 1:
+        raise ValueError("Columns must all have the same length.")
+    return zip(*(columns[n] for n in names))
+
+
+class _Load:
+    """
+    Renders a statement as a prefix, one piece per row joined by a separator, and a suffix.
+    """
+
+    separator = ", "
+
+    def __init__(
+        self,
+        entity: Entity,
+        columns: Sequence[str],
+        dialect: Union[str, Dialect] = "sqlite",
+        batch_rows: Optional[int] = DEFAULT_BATCH_ROWS,
+    ):
+        if not columns:
+            raise ValueError("At least one column is required.")
+        self.entity = entity
+        self.columns = list(columns)
+        self.dialect = get_dialect(dialect)
+        self.batch_rows = batch_rows
+        self._rows: Optional[Iterable[Any]] = None
+
+    def rows(self, rows: Iterable[Union[Sequence[Any], Mapping[str, Any]]]) -> "_Load":
+        """
+        Load rows from an iterable of sequences laid out as the columns, or of dicts.
+        """
+        self._rows = rows
+        return self
+
+    def from_columns(self, columns: Mapping[str, Sequence[Any]]) -> "_Load":
+        """
+        Load rows from equally long columns, keyed by column name.
+        """
+        self._rows = rows_from_columns(columns, self.columns)
+        return self
+
+    def _values(self) -> Iterator[List[Any]]:
+        if self._rows is None:
+            raise ValueError("No rows to load.")
+        for row in self._rows:
+            if isinstance(row, Mapping):
+                values = [row.get(c) for c in self.columns]
+            else:
+                values = list(row)
+                if len(values) != len(self.columns):
+                    raise ValueError(
+                        f"Expected {len(self.columns)} values per row, got {len(values)}."
+                    )
+            yield [_python(v) for v in values]
+
+    def prefix(self) -> str:
+        raise NotImplementedError()
+
+    def row(self, values: List[str], first: bool) -> str:
+        raise NotImplementedError()
+
+    def suffix(self) -> str:
+        return ""
+
+    def _rows_per_batch(self) -> Optional[int]:
+        limits = [self.batch_rows, self.dialect.max_rows]
+        if self.dialect.max_params:
+            limits.append(max(self.dialect.max_params // len(self.columns), 1))
+        limits = [n for n in limits if n]
+        return min(limits) if limits else None
+
+    def batches(self, parametrize: bool = True) -> Iterator[Batch]:
+        """
+        Multi-row statements, each as large as the dialect's limits and `batch_rows` allow.
+        Parameters follow the dialect's paramstyle; without `parametrize`, values are inlined as
+        literals.
+        """
+        template = PARAMSTYLES[self.dialect.paramstyle]
+        prefix, suffix = self.prefix(), self.suffix()
+        fixed = len(prefix.encode()) + len(suffix.encode())
+        max_rows = self._rows_per_batch()
+        max_bytes = self.dialect.max_statement_bytes
+
+        pieces: List[str] = []
+        params: List[Any] = []
+        size = fixed
+
+        def flush() -> Batch:
+            return Batch(prefix + self.separator.join(pieces) + suffix, params, len(pieces))
+
+        for values in self._values():
+            if parametrize:
+                n = len(params)
+                rendered = [template.format(n=n + i) for i in range(1, len(values) + 1)]
+            else:
+                rendered = [literal(v) for v in values]
+
+            piece = self.row(rendered, not pieces)
+            piece_size = len(piece.encode()) + (len(self.separator) if pieces else 0)
+            if pieces and (
+                (max_rows and len(pieces) >= max_rows)
+                or (max_bytes and size + piece_size > max_bytes)
+            ):
+                yield flush()
+                pieces, params, size = [], [], fixed
+                # Rows are rendered differently at the start of a statement, and numbered anew
+                if parametrize:
+                    rendered = [template.format(n=i) for i in range(1, len(values) + 1)]
+                piece = self.row(rendered, True)
+                piece_size = len(piece.encode())
+
+            if max_bytes and fixed + piece_size > max_bytes:
+                raise ValueError(f"A single row does not fit in {max_bytes} bytes.")
+            pieces.append(piece)
+            if parametrize:
+                params.extend(values)
+            size += piece_size
+
+        if pieces:
+            yield flush()
+
+    def parameter_batches(self) -> Iterator[Batch]:
+        """
+        A single-row statement with the parameters of many rows, for `executemany`.
+        """
+        template = PARAMSTYLES[self.dialect.paramstyle]
+        sql = (
+            self.prefix()
+            + self.row([template.format(n=i) for i in range(1, len(self.columns) + 1)], True)
+            + self.suffix()
+        )
+        size = self.batch_rows or DEFAULT_BATCH_ROWS
+        values = self._values()
+        while True:
+            chunk = list(islice(values, size))
+            if not chunk:
+                return
+            yield Batch(sql, chunk, len(chunk), many=True)
+
+    def execute(
+        self,
+        executor: Callable[[str, Any], Any],
+        many: bool = False,
+        parametrize: bool = True,
+    ) -> int:
+        """
+        Stream the batches into `executor(sql, params)` - e.g. `cursor.execute`, or
+        `cursor.executemany` when `many` is set - and return the number of rows sent.
+        """
+        total = 0
+        for batch in self.parameter_batches() if many else self.batches(parametrize):
+            executor(batch.sql, batch.params if many or parametrize else ())
+            total += batch.rows
+        return total
+
+
+class Insert(_Load):
+    """
+    `insert into entity (columns) values (...), (...)`
+    """
+
+    def prefix(self) -> str:
+        return f"insert into {self.entity.ref} ({', '.join(self.columns)}) values "
+
+    def row(self, values: List[str], first: bool) -> str:
+        return f"({', '.join(values)})"
+
+
+class Merge(_Load):
+    """
+    `merge into entity using (rows) on keys`: rows matching on `keys` have the `update` columns
+    (by default all other columns) updated, and other rows are inserted if `insert` is set.
+    """
+
+    separator = " union all "
+
+    def __init__(
+        self,
+        entity: Entity,
+        columns: Sequence[str],
+        keys: Sequence[str],
+        update: Optional[Sequence[str]] = None,
+        insert: bool = True,
+        dialect: Union[str, Dialect] = "snowflake",
+        batch_rows: Optional[int] = DEFAULT_BATCH_ROWS,
+    ):
+        super().__init__(entity, columns, dialect, batch_rows)
+        missing = [k for k in keys if k not in self.columns]
+        if not keys or missing:
+            raise ValueError("Keys must be a non-empty subset of the columns.")
+        self.keys = list(keys)
+        self.update = (
+            list(update) if update is not None else [c for c in self.columns if c not in keys]
+        )
+        self.insert = insert
+        self.target = entity._alias or "t"
+        # Must differ from the target's alias, or the on clause compares the source to itself
+        self.source = "s" if self.target.lower() != "s" else "src"
+
+    def prefix(self) -> str:
+        return f"merge into {self.entity.ref} {self.target} using ("
+
+    def row(self, values: List[str], first: bool) -> str:
+        # Only the first select of the union names its columns
+        if first:
+            values = [f"{v} as {c}" for v, c in zip(values, self.columns)]
+        return f"select {', '.join(values)}"
+
+    def suffix(self) -> str:
+        t, s = self.target, self.source
+        on = " and ".join(f"{t}.{k} = {s}.{k}" for k in self.keys)
+        sql = f") {s} on {on}"
+        if self.update:
+            sql += " when matched then update set " + ", ".join(
+                f"{c} = {s}.{c}" for c in self.update
+            )
+        if self.insert:
+            sql += (
+                f" when not matched then insert ({', '.join(self.columns)})"
+                f" values ({', '.join(f'{s}.{c}' for c in self.columns)})"
+            )
+        return sql
+
+
+class Upsert(_Load):
+    """
+    Insert rows, updating the `update` columns (by default all other columns) of rows that already
+    exist with the same `keys`. Rendered as `insert ... on conflict` where the dialect has it, and
+    as a merge otherwise.
+    """
+
+    def __init__(
+        self,
+        entity: Entity,
+        columns: Sequence[str],
+        keys: Sequence[str],
+        update: Optional[Sequence[str]] = None,
+        dialect: Union[str, Dialect] = "sqlite",
+        batch_rows: Optional[int] = DEFAULT_BATCH_ROWS,
+    ):
+        super().__init__(entity, columns, dialect, batch_rows)
+        missing = [k for k in keys if k not in self.columns]
+        if not keys or missing:
+            raise ValueError("Keys must be a non-empty subset of the columns.")
+        self.keys = list(keys)
+        self.update = (
+            list(update) if update is not None else [c for c in self.columns if c not in keys]
+        )
+        self._statement: _Load = (
+            Insert(entity, columns, self.dialect, batch_rows)
+            if self.dialect.upsert == "on conflict"
+            else Merge(entity, columns, keys, update, True, self.dialect, batch_rows)
+        )
+        self.separator = self._statement.separator
+
+    def prefix(self) -> str:
+        return self._statement.prefix()
+
+    def row(self, values: List[str], first: bool) -> str:
+        return self._statement.row(values, first)
+
+    def suffix(self) -> str:
+        if self.dialect.upsert != "on conflict":
+            return self._statement.suffix()
+        sql = f" on conflict ({', '.join(self.keys)}) do "
+        if not self.update:
+            return sql + "nothing"
+        return sql + "update set " + ", ".join(f"{c} = excluded.{c}" for c in self.update)
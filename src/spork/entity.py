@@ -1,3 +1,6 @@
+from typing import List, Optional, Tuple
+
+
 class Entity:
     """
     An Entity functions much as an Expression, but represents a table or view.
@@ -6,10 +9,37 @@ class Entity:
     def __init__(self, ref: str):
         self.ref = ref
         self._alias = ""
+        self.unique_keys: List[Tuple[str, ...]] = []
+        self._sample: Optional[str] = None
+        self._sample_before_alias = False
 
     def alias(self, to: str):
         self._alias = to
         return self
 
+    def unique(self, *cols: str) -> "Entity":
+        """
+        Declare a set of columns as unique for this entity, e.g. a primary key. Used by the
+        optimizer to decide whether a join can change the number of rows.
+        """
+        self.unique_keys.append(tuple(c.lower() for c in cols))
+        return self
+
+    def sample(self, clause: str, before_alias: bool = False) -> "Entity":
+        """
+        Read a sample of the entity, e.g. `sample("tablesample bernoulli (10)")`. Some engines
+        expect the sampling clause before the alias.
+        """
+        self._sample = clause
+        self._sample_before_alias = before_alias
+        return self
+
     def to_string(self) -> str:
+        if self._sample:
+            parts = (
+                [self.ref, self._sample, self._alias]
+                if self._sample_before_alias
+                else [self.ref, self._alias, self._sample]
+            )
+            return " ".join(p for p in parts if p)
         return f"{self.ref} {self._alias}"
@@ -1,4 +1,4 @@
-from typing import Any, Optional, Union
+from typing import Any, Callable, Optional, Sequence, Tuple, Union
 
 from .types import Ordering, Op, NullCheck, OrderingNulls
 
@@ -23,6 +23,7 @@ class Expression:
         self.ordering: Optional[Ordering] = None
         self.null_check: Optional[NullCheck] = None
         self.ordering_nulls: Optional[OrderingNulls] = None
+        self.bounds: Optional[Tuple["Expression", "Expression"]] = None
 
     def cast(self, t: str) -> "Expression":
         self.cast_to = t
@@ -159,9 +160,28 @@ class Expression:
             op=Op.BETWEEN,
             rhs=Expression(f"{lower.to_string()} and {upper.to_string()}"),
         )
+        result.bounds = (lower, upper)
         result.__reset_aliases()
         return result
 
+    def compile_python(self, columns: Optional[Sequence[str]] = None) -> Callable[[Any], Any]:
+        """
+        Compile the expression into a Python function evaluating it for a single record, using SQL
+        null semantics. Records are dicts keyed by column name, or tuples laid out as `columns`.
+        """
+        from .codegen import compile_expression
+
+        return compile_expression(self, columns)
+
+    def to_canonical_string(self) -> str:
+        """
+        Render the expression with its commutative operands sorted and comparisons normalized, so
+        that equivalent expressions render identically.
+        """
+        from .canonical import canonical_expression
+
+        return canonical_expression(self)
+
     def to_string(self) -> str:
         """Render the expression as a SQL-compatible string."""
         # Render lhs
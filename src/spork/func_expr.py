@@ -17,11 +17,13 @@ class FuncExpr(Expression):
         args: Optional[List[Union[str, Expression]]] = None,
         window: Optional[Window] = None,
         alias: Optional[str] = None,
+        distinct: bool = False,
     ):
         super().__init__(lhs=f, op=None, rhs=None, alias=alias)
         self.f = f
         self.args = args or []
         self.window = window
+        self.distinct = distinct
 
     def over(self, window: Window):
         self.window = window
@@ -39,6 +41,8 @@ class FuncExpr(Expression):
                 for arg in self.args
                 if arg is not None  # Skip None values
             )
+            if self.distinct:
+                args_str = f"distinct {args_str}"
             func_str = f"{self.f.value}({args_str})"
 
         # Append window specification if present
@@ -0,0 +1,313 @@
+"""
+Performance regression harness for generated SQL.
+
+A corpus of query fixtures is run against a local engine loaded with seeded synthetic data. The
+plan (`EXPLAIN`) and timing of every fixture is captured and diffed against a stored baseline, and
+changes in plan shape - new full scans, lost index use, extra sorts - are flagged.
+
+sqlite3 is supported out of the box; other local engines plug in by subclassing `Backend`.
+"""
+import json
+import random
+import re
+import sqlite3
+import statistics
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from spork.query import Query
+
+
+# Column generators: called with a seeded `random.Random` and the row number
+Generator = Callable[[random.Random, int], Any]
+
+
+def serial(start: int = 1) -> Generator:
+    return lambda rng, i: start + i
+
+
+def integers(lo: int, hi: int) -> Generator:
+    return lambda rng, i: rng.randint(lo, hi)
+
+
+def floats(lo: float, hi: float) -> Generator:
+    return lambda rng, i: rng.uniform(lo, hi)
+
+
+def choice(values: Sequence[Any]) -> Generator:
+    return lambda rng, i: rng.choice(values)
+
+
+def text(distinct: int, prefix: str = "v") -> Generator:
+    return lambda rng, i: f"{prefix}{rng.randrange(distinct)}"
+
+
+def nullable(gen: Generator, fraction: float) -> Generator:
+    return lambda rng, i: None if rng.random() < fraction else gen(rng, i)
+
+
+class Table:
+    """
+    A synthetic table: generated columns, a row count and the indexes to create on it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rows: int,
+        columns: Dict[str, Generator],
+        indexes: Optional[List[Tuple[str, ...]]] = None,
+    ):
+        self.name = name
+        self.rows = rows
+        self.columns = columns
+        self.indexes = indexes or []
+
+    def generate(self, seed: int) -> List[tuple]:
+        # Seed per table, so that adding a table leaves the data of the others unchanged
+        rng = random.Random(f"{seed}:{self.name}")
+        gens = list(self.columns.values())
+        return [tuple(gen(rng, i) for gen in gens) for i in range(self.rows)]
+
+
+class Fixture:
+    """
+    A named query and the tables it runs against.
+    """
+
+    def __init__(self, name: str, query: Query, tables: List[Table]):
+        self.name = name
+        self.query = query
+        self.tables = tables
+
+
+class PlanShape:
+    """
+    The performance-relevant features of a plan: which tables are fully scanned, which are read
+    through an index, and how many sorts are performed.
+    """
+
+    def __init__(self, scans: List[str], indexed: List[str], sorts: int):
+        self.scans = sorted(scans)
+        self.indexed = sorted(indexed)
+        self.sorts = sorts
+
+
+class Backend:
+    """
+    A local engine the harness can load data into and run queries against.
+    """
+
+    def load(self, tables: List[Table], seed: int):
+        raise NotImplementedError
+
+    def explain(self, sql: str) -> List[str]:
+        raise NotImplementedError
+
+    def shape(self, plan: List[str]) -> PlanShape:
+        raise NotImplementedError
+
+    def run(self, sql: str):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SQLiteBackend(Backend):
+    _SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?(.*)$")
+    _SEARCH = re.compile(r"^SEARCH (\w+)(?: AS \w+)?(.*)$")
+
+    def __init__(self, path: str = ":memory:"):
+        self.conn = sqlite3.connect(path)
+
+    def load(self, tables: List[Table], seed: int):
+        for table in tables:
+            cols = list(table.columns)
+            self.conn.execute(f"drop table if exists {table.name}")
+            self.conn.execute(f"create table {table.name} ({', '.join(cols)})")
+            self.conn.executemany(
+                f"insert into {table.name} values ({', '.join('?' for _ in cols)})",
+                table.generate(seed),
+            )
+            for n, index in enumerate(table.indexes):
+                self.conn.execute(
+                    f"create index ix_{table.name}_{n} on {table.name} ({', '.join(index)})"
+                )
+        self.conn.execute("analyze")
+        self.conn.commit()
+
+    def explain(self, sql: str) -> List[str]:
+        rows = self.conn.execute(f"explain query plan {sql}").fetchall()
+
+        # Indent each step under its parent
+        depth = {0: -1}
+        plan = []
+        for node, parent, _, detail in rows:
+            depth[node] = depth.get(parent, -1) + 1
+            plan.append("  " * depth[node] + detail)
+        return plan
+
+    def shape(self, plan: List[str]) -> PlanShape:
+        scans, indexed, sorts = [], [], 0
+        for line in (line.strip() for line in plan):
+            scan, search = self._SCAN.match(line), self._SEARCH.match(line)
+            if scan:
+                (indexed if "INDEX" in scan.group(2) else scans).append(scan.group(1))
+            elif search:
+                indexed.append(search.group(1))
+            elif line.startswith("USE TEMP B-TREE"):
+                sorts += 1
+        return PlanShape(scans, indexed, sorts)
+
+    def run(self, sql: str):
+        return self.conn.execute(sql).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+class Snapshot:
+    """
+    The captured plan and median run time of one fixture.
+    """
+
+    def __init__(self, plan: List[str], seconds: float):
+        self.plan = plan
+        self.seconds = seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"plan": self.plan, "seconds": self.seconds}
+
+    @staticmethod
+    def from_dict(d: Dict[str, Any]) -> "Snapshot":
+        return Snapshot(d["plan"], d["seconds"])
+
+
+def measure(backend: Backend, sql: str, repeat: int = 5) -> Snapshot:
+    """
+    Capture the plan and median run time of `sql` on a loaded backend.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        backend.run(sql)
+        timings.append(time.perf_counter() - start)
+    return Snapshot(backend.explain(sql), statistics.median(timings))
+
+
+class Regression:
+    """
+    A difference between a baseline and a current snapshot.
+    """
+
+    NEW_SCAN = "new scan"
+    LOST_INDEX = "lost index"
+    EXTRA_SORT = "extra sort"
+    PLAN_CHANGED = "plan changed"
+    SLOWER = "slower"
+
+    def __init__(self, fixture: str, kind: str, detail: str):
+        self.fixture = fixture
+        self.kind = kind
+        self.detail = detail
+
+    def __repr__(self) -> str:
+        return f"Regression({self.fixture}: {self.kind}, {self.detail})"
+
+
+class Harness:
+    def __init__(
+        self,
+        fixtures: List[Fixture],
+        backend: Callable[[], Backend] = SQLiteBackend,
+        seed: int = 0,
+        repeat: int = 5,
+    ):
+        self.fixtures = fixtures
+        self.backend = backend
+        self.seed = seed
+        self.repeat = repeat
+
+    def capture(self) -> Dict[str, Snapshot]:
+        """
+        Run every fixture on a freshly loaded backend and capture its plan and median run time.
+        """
+        snapshots = {}
+        for fixture in self.fixtures:
+            backend = self.backend()
+            try:
+                backend.load(fixture.tables, self.seed)
+                snapshots[fixture.name] = measure(backend, fixture.query.to_string(), self.repeat)
+            finally:
+                backend.close()
+        return snapshots
+
+    def compare(
+        self,
+        baseline: Dict[str, Snapshot],
+        current: Dict[str, Snapshot],
+        slowdown: float = 2.0,
+    ) -> List[Regression]:
+        """
+        Diff current snapshots against a baseline. Timings are only flagged when they grow by more
+        than a factor of `slowdown`, as they are noisy.
+        """
+        backend = self.backend()
+        try:
+            shapes = {
+                name: (backend.shape(baseline[name].plan), backend.shape(now.plan))
+                for name, now in current.items()
+                if name in baseline
+            }
+        finally:
+            backend.close()
+
+        regressions = []
+        for name, (old, new) in shapes.items():
+            before, now = baseline[name], current[name]
+            for table in sorted(set(new.scans) - set(old.scans)):
+                regressions.append(Regression(name, Regression.NEW_SCAN, table))
+            for table in sorted(set(old.indexed) - set(new.indexed)):
+                regressions.append(Regression(name, Regression.LOST_INDEX, table))
+            if new.sorts > old.sorts:
+                regressions.append(
+                    Regression(name, Regression.EXTRA_SORT, f"{old.sorts} -> {new.sorts}")
+                )
+            if before.plan != now.plan:
+                regressions.append(
+                    Regression(name, Regression.PLAN_CHANGED, "\n".join(now.plan))
+                )
+            if before.seconds and now.seconds > before.seconds * slowdown:
+                regressions.append(
+                    Regression(
+                        name, Regression.SLOWER, f"{before.seconds:.6f}s -> {now.seconds:.6f}s"
+                    )
+                )
+        return regressions
+
+    def check(self, path: str, update: bool = False) -> List[Regression]:
+        """
+        Capture the fixtures and compare them to the baseline stored at `path`. The baseline is
+        written when missing, or when `update` is set.
+        """
+        current = self.capture()
+        try:
+            baseline = load_baseline(path)
+        except FileNotFoundError:
+            baseline = None
+
+        regressions = self.compare(baseline, current) if baseline is not None else []
+        if baseline is None or update:
+            save_baseline(path, current)
+        return regressions
+
+
+def save_baseline(path: str, snapshots: Dict[str, Snapshot]):
+    with open(path, "w") as f:
+        json.dump({name: s.to_dict() for name, s in snapshots.items()}, f, indent=2, sort_keys=True)
+
+
+def load_baseline(path: str) -> Dict[str, Snapshot]:
+    with open(path) as f:
+        return {name: Snapshot.from_dict(d) for name, d in json.load(f).items()}
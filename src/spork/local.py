@@ -0,0 +1,723 @@
+"""
+Vectorized execution of queries against in-memory columnar data, without a database.
+
+Tables are dicts of column name to array, keyed by `Entity.ref`. Nulls are given either as
+`numpy.ma.MaskedArray` masks or as `None` entries. Results come back as a dict of output column
+name to `numpy.ma.MaskedArray`.
+
+Unlike SQL engines, the result cannot hold two columns of the same name, compared ignoring case:
+a selection such as `f.Id, d.Id` raises a `ValueError`, and has to alias one of the columns.
+
+Where SQL engines disagree, PostgreSQL semantics are followed: nulls sort last ascending and first
+descending, integer division truncates. Division by zero yields null rather than an error.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+from spork.analysis import (
+    AGGREGATES,
+    column_refs,
+    conjuncts,
+    exp_str,
+    is_aggregate,
+    is_identifier,
+    is_leaf,
+    leaf_text,
+    output_name,
+    parse_literal,
+    split_ref,
+)
+from spork.entity import Entity
+from spork.expression import Expression
+from spork.func_expr import FuncExpr
+from spork.query import Dataset, Join, Query
+from spork.types import FuncLabel, InclusionType, Op, NullCheck, Ordering, OrderingNulls
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+_CASTS = {
+    "int": "int64",
+    "integer": "int64",
+    "bigint": "int64",
+    "smallint": "int64",
+    "tinyint": "int64",
+    "float": "float64",
+    "double": "float64",
+    "real": "float64",
+    "decimal": "float64",
+    "numeric": "float64",
+    "number": "float64",
+    "text": "str",
+    "varchar": "str",
+    "string": "str",
+    "char": "str",
+    "boolean": "bool",
+    "bool": "bool",
+    "timestamp": "datetime64[us]",
+    "datetime": "datetime64[us]",
+    "date": "datetime64[D]",
+}
+
+
+class Column:
+    """
+    A column of values and a null mask of the same length.
+    """
+
+    def __init__(self, data, mask=None):
+        self.data = data
+        self.mask = np.zeros(len(data), dtype=bool) if mask is None else mask
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def take(self, idx) -> "Column":
+        """
+        Gather rows by index; negative indices produce nulls.
+        """
+        missing = idx < 0
+        if len(self.data) == 0:
+            return Column(np.zeros(len(idx), dtype=self.data.dtype), np.ones(len(idx), dtype=bool))
+        safe = np.where(missing, 0, idx)
+        return Column(self.data[safe], self.mask[safe] | missing)
+
+    def to_masked(self):
+        return np.ma.MaskedArray(self.data, mask=self.mask.copy())
+
+
+def to_column(values) -> Column:
+    """
+    Convert an array-like with optional nulls (masked entries or `None`) to a Column.
+    """
+    if isinstance(values, np.ma.MaskedArray):
+        return Column(np.asarray(values.data), np.ma.getmaskarray(values).copy())
+
+    arr = np.asarray(values)
+    if arr.dtype != object:
+        return Column(arr)
+
+    mask = np.array([v is None for v in arr], dtype=bool)
+    present = [v for v in arr if v is not None]
+    typed = np.asarray(present) if present else np.zeros(0)
+    data = np.zeros(len(arr), dtype=typed.dtype)
+    data[~mask] = typed
+    return Column(data, mask)
+
+
+def _constant(value, n: int) -> Column:
+    if value is None:
+        return Column(np.zeros(n), np.ones(n, dtype=bool))
+    return Column(np.full(n, value))
+
+
+class Frame:
+    """
+    A set of rows: columns keyed by (qualifier, name), all of the same length.
+    """
+
+    def __init__(self, n: int, columns: Optional[Dict[Tuple[Optional[str], str], Column]] = None):
+        self.n = n
+        self.columns = columns or {}
+        # Original spelling of each column name, for `select *`
+        self.names: Dict[Tuple[Optional[str], str], str] = {}
+
+    def add(self, qualifier: Optional[str], name: str, column: Column):
+        key = (qualifier.lower() if qualifier else None, name.lower())
+        self.columns[key] = column
+        self.names[key] = name
+
+    def lookup(self, qualifier: Optional[str], name: str) -> Optional[Column]:
+        if qualifier is not None:
+            return self.columns.get((qualifier, name))
+
+        matches = [c for (q, n), c in self.columns.items() if n == name]
+        if len(matches) > 1:
+            raise ValueError(f"Ambiguous column reference: {name}")
+        return matches[0] if matches else None
+
+    def qualifiers(self) -> set:
+        return {q for q, _ in self.columns}
+
+    def take(self, idx) -> "Frame":
+        frame = Frame(len(idx), {k: c.take(idx) for k, c in self.columns.items()})
+        frame.names = dict(self.names)
+        return frame
+
+
+def factorize(cols: List[Column]) -> Tuple[Any, int]:
+    """
+    Assign each row an integer code such that rows with equal values (nulls included) share a code.
+    Codes are ordered by value, nulls last.
+    """
+    n = len(cols[0]) if cols else 0
+    codes = np.zeros(n, dtype=np.int64)
+    for c in cols:
+        uniques, inverse = np.unique(c.data, return_inverse=True)
+        inverse = np.where(c.mask, len(uniques), inverse.reshape(-1))
+        codes = codes * (len(uniques) + 1) + inverse
+        # Keep the codes dense so that they never overflow
+        _, codes = np.unique(codes, return_inverse=True)
+        codes = codes.reshape(-1)
+    return codes, (int(codes.max()) + 1 if n else 0)
+
+
+class Context:
+    """
+    The rows an expression is evaluated against. When grouped, expressions evaluate to one value
+    per group: aggregates reduce their argument by group, plain columns take the group's first row.
+    """
+
+    def __init__(self, frame: Frame, codes=None, n_groups: int = 0):
+        self.frame = frame
+        self.codes = codes
+        self.n_groups = n_groups
+        self.first = None
+        if codes is not None:
+            order = np.argsort(codes, kind="stable")
+            start = np.searchsorted(codes[order], np.arange(n_groups))
+            # A group without rows - the single group of an aggregate over no rows - has null columns
+            empty = np.bincount(codes, minlength=n_groups) == 0
+            self.first = np.full(n_groups, -1, dtype=np.int64)
+            self.first[~empty] = order[start[~empty]]
+        # Selection aliases, visible to having, qualify and order by where no column has the name
+        self.aliases: Dict[str, Column] = {}
+
+    @property
+    def n(self) -> int:
+        return self.n_groups if self.codes is not None else self.frame.n
+
+    def row_context(self) -> "Context":
+        return Context(self.frame)
+
+
+def _ordering(exp: Expression) -> Tuple[Optional[Ordering], Optional[OrderingNulls]]:
+    ordering, nulls = exp.ordering, exp.ordering_nulls
+    while not ordering and not nulls and isinstance(exp.lhs, Expression) and exp.op is None:
+        exp = exp.lhs
+        ordering, nulls = exp.ordering, exp.ordering_nulls
+    return ordering, nulls
+
+
+def sort_codes(column: Column, ordering: Optional[Ordering], nulls: Optional[OrderingNulls]):
+    """
+    Integer sort keys for a column, so that ascending order of the keys is the requested order.
+    """
+    uniques, inverse = np.unique(column.data, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    descending = ordering == Ordering.DESC
+    if descending:
+        inverse = len(uniques) - 1 - inverse
+
+    nulls_first = nulls == OrderingNulls.NULLS_FIRST if nulls else descending
+    return np.where(column.mask, -1 if nulls_first else len(uniques), inverse)
+
+
+class Executor:
+    """
+    Runs queries against a set of in-memory tables.
+    """
+
+    def __init__(self, tables: Dict[str, Dict[str, Any]]):
+        if np is None:
+            raise ImportError("The local execution engine requires numpy.")
+        self.tables = {
+            ref.lower(): {name: to_column(values) for name, values in table.items()}
+            for ref, table in tables.items()
+        }
+
+    def execute(self, query: Query) -> Dict[str, Any]:
+        names, cols = self._run(query)
+        return {name: c.to_masked() for name, c in zip(names, cols)}
+
+    # Sources
+
+    def _entity(self, entity: Entity) -> Frame:
+        table = self.tables.get(entity.ref.lower())
+        if table is None:
+            raise ValueError(f"Unknown table: {entity.ref}")
+
+        qualifier = entity._alias or entity.ref.split(".")[-1]
+        n = len(next(iter(table.values()))) if table else 0
+        frame = Frame(n)
+        for name, c in table.items():
+            frame.add(qualifier, name, c)
+        return frame
+
+    def _source(self, what) -> Frame:
+        if isinstance(what, Entity):
+            return self._entity(what)
+        if isinstance(what, Query):
+            names, cols = self._run(what)
+            frame = Frame(len(cols[0]) if cols else 0)
+            for name, c in zip(names, cols):
+                frame.add(what._alias or None, name, c)
+            return frame
+        raise NotImplementedError(f"Cannot join {type(what).__name__} locally.")
+
+    def _dataset(self, dataset: Dataset) -> Frame:
+        frame = self._entity(dataset.entity)
+        for join in dataset.joins:
+            frame = self._join(frame, self._source(join.what), join)
+        return frame
+
+    # Joins
+
+    def _side(self, exp: Expression, left: Frame, right: Frame) -> Optional[str]:
+        """
+        Which frame an expression can be evaluated against, if only one of them.
+        """
+        sides = set()
+        for qualifier, name in column_refs(exp):
+            in_left = (qualifier in left.qualifiers()) if qualifier else any(
+                n == name for _, n in left.columns
+            )
+            in_right = (qualifier in right.qualifiers()) if qualifier else any(
+                n == name for _, n in right.columns
+            )
+            if in_left == in_right:
+                return None
+            sides.add("left" if in_left else "right")
+        return sides.pop() if len(sides) == 1 else None
+
+    def _join(self, left: Frame, right: Frame, join: Join) -> Frame:
+        left_keys, right_keys, residual = [], [], []
+        for c in conjuncts(join.on):
+            if c.op == Op.EQ and not (c.negate or c.cast_to or c.null_check):
+                sides = (self._side(c.lhs, left, right), self._side(c.rhs, left, right))
+                if sides in (("left", "right"), ("right", "left")):
+                    l_exp, r_exp = (c.lhs, c.rhs) if sides[0] == "left" else (c.rhs, c.lhs)
+                    left_keys.append(self._eval(l_exp, Context(left)))
+                    right_keys.append(self._eval(r_exp, Context(right)))
+                    continue
+            residual.append(c)
+
+        li, ri = self._match(left_keys, right_keys, left.n, right.n)
+
+        if residual:
+            pairs = self._combine(left, right, li, ri)
+            keep = np.ones(pairs.n, dtype=bool)
+            for c in residual:
+                result = self._eval(c, Context(pairs))
+                keep &= result.data.astype(bool) & ~result.mask
+            li, ri = li[keep], ri[keep]
+
+        how = join.how
+        if how in (InclusionType.LEFT_ANTI, InclusionType.RIGHT_ANTI):
+            frame, n = (left, left.n) if how == InclusionType.LEFT_ANTI else (right, right.n)
+            matched = np.zeros(n, dtype=bool)
+            matched[li if how == InclusionType.LEFT_ANTI else ri] = True
+            return frame.take(np.flatnonzero(~matched))
+
+        if how in (InclusionType.LEFT, InclusionType.FULL_OUTER):
+            unmatched = np.ones(left.n, dtype=bool)
+            unmatched[li] = False
+            extra = np.flatnonzero(unmatched)
+            li = np.concatenate([li, extra])
+            ri = np.concatenate([ri, np.full(len(extra), -1)])
+        if how in (InclusionType.RIGHT, InclusionType.FULL_OUTER):
+            unmatched = np.ones(right.n, dtype=bool)
+            unmatched[ri[ri >= 0]] = False
+            extra = np.flatnonzero(unmatched)
+            li = np.concatenate([li, np.full(len(extra), -1)])
+            ri = np.concatenate([ri, extra])
+
+        return self._combine(left, right, li, ri)
+
+    @staticmethod
+    def _match(left_keys: List[Column], right_keys: List[Column], nl: int, nr: int):
+        """
+        Index pairs of rows with equal, non-null keys. Without keys, every pair matches.
+        """
+        if not left_keys:
+            return np.repeat(np.arange(nl), nr), np.tile(np.arange(nr), nl)
+
+        # Factorize both sides together so that equal keys get equal codes
+        combined = [
+            Column(np.concatenate([lk.data, rk.data]), np.concatenate([lk.mask, rk.mask]))
+            for lk, rk in zip(left_keys, right_keys)
+        ]
+        codes, _ = factorize(combined)
+        null = np.any([c.mask for c in combined], axis=0)
+        left_codes = np.where(null[:nl], -2, codes[:nl])
+        right_codes = np.where(null[nl:], -1, codes[nl:])
+
+        order = np.argsort(right_codes, kind="stable")
+        sorted_codes = right_codes[order]
+        lo = np.searchsorted(sorted_codes, left_codes, side="left")
+        hi = np.searchsorted(sorted_codes, left_codes, side="right")
+        counts = hi - lo
+
+        li = np.repeat(np.arange(nl), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        ri = order[np.repeat(lo, counts) + offsets]
+        return li, ri
+
+    @staticmethod
+    def _combine(left: Frame, right: Frame, li, ri) -> Frame:
+        frame = left.take(li)
+        for key, c in right.columns.items():
+            frame.columns[key] = c.take(ri)
+            frame.names[key] = right.names[key]
+        return frame
+
+    # Queries
+
+    def _run(self, query: Query) -> Tuple[List[str], List[Column]]:
+        if not query.selection:
+            raise ValueError("A query must have a selection.")
+        if not query.dataset:
+            raise ValueError("A query must have a dataset.")
+
+        frame = self._dataset(query.dataset)
+
+        if query._where is not None:
+            frame = frame.take(np.flatnonzero(self._truthy(query._where, Context(frame))))
+
+        ctx = Context(frame)
+        grouped = bool(query._group_by) or any(
+            is_aggregate(exp) for exp in query.selection.cols + [query._having]
+        )
+        if grouped:
+            keys = [self._eval(exp, ctx) for exp in query._group_by or []]
+            if keys:
+                codes, n_groups = factorize(keys)
+            else:
+                # An aggregate without group by has a single group, even over no rows
+                codes, n_groups = np.zeros(frame.n, dtype=np.int64), 1
+            ctx = Context(frame, codes, n_groups)
+
+        names, cols = [], []
+        for exp in query.selection.cols:
+            for name, c in self._select(exp, ctx):
+                if name.lower() in (n.lower() for n in names):
+                    raise ValueError(f"Duplicate output column: {name}; alias one of them")
+                names.append(name)
+                cols.append(c)
+        # Only after the selection: it cannot refer to its own aliases
+        ctx.aliases = {name.lower(): c for name, c in zip(names, cols)}
+
+        keep = np.ones(ctx.n, dtype=bool)
+        for exp in (query._having, query._qualify):
+            if exp is not None:
+                keep &= self._truthy(exp, ctx)
+
+        keys = []
+        for exp in query._order_by or []:
+            keys.append(sort_codes(self._eval(exp, ctx), *_ordering(exp)))
+
+        rows = np.flatnonzero(keep)
+        if keys:
+            # lexsort sorts by its last key first
+            rows = rows[np.lexsort([k[rows] for k in reversed(keys)])]
+
+        return names, [c.take(rows) for c in cols]
+
+    def _select(self, exp: Expression, ctx: Context) -> List[Tuple[str, Column]]:
+        if is_leaf(exp) and not exp._alias:
+            text = leaf_text(exp)
+            if text == "*" or text.endswith(".*"):
+                qualifier = split_ref(text)[0]
+                rows = ctx.first if ctx.codes is not None else np.arange(ctx.frame.n)
+                return [
+                    (ctx.frame.names[key], c.take(rows))
+                    for key, c in ctx.frame.columns.items()
+                    if qualifier is None or key[0] == qualifier
+                ]
+
+        name = exp._alias or output_name(exp) and leaf_text(exp).split(".")[-1] or exp_str(exp)
+        return [(name, self._eval(exp, ctx))]
+
+    def _truthy(self, exp: Expression, ctx: Context):
+        result = self._eval(exp, ctx)
+        return result.data.astype(bool) & ~result.mask
+
+    # Expressions
+
+    def _eval(self, exp: Any, ctx: Context) -> Column:
+        if not isinstance(exp, Expression):
+            return self._leaf(str(exp), ctx)
+
+        if isinstance(exp, FuncExpr):
+            if exp.window is not None:
+                if ctx.codes is not None:
+                    raise NotImplementedError("Window functions over grouped rows are not supported.")
+                result = self._window(exp, ctx)
+            elif exp.f.value in AGGREGATES:
+                result = self._aggregate(exp, ctx)
+            else:
+                raise NotImplementedError(f"{exp.f.value} requires a window.")
+        elif exp.op is None:
+            result = self._eval(exp.lhs, ctx)
+        elif exp.op == Op.BETWEEN:
+            value = self._eval(exp.lhs, ctx)
+            if exp.bounds is None:
+                raise NotImplementedError("Cannot evaluate an unstructured between.")
+            lower, upper = (self._eval(b, ctx) for b in exp.bounds)
+            result = self._logical(
+                Op.AND, self._compare(Op.GEQ, value, lower), self._compare(Op.LEQ, value, upper)
+            )
+        else:
+            lhs, rhs = self._eval(exp.lhs, ctx), self._eval(exp.rhs, ctx)
+            if exp.op in (Op.AND, Op.OR):
+                result = self._logical(exp.op, lhs, rhs)
+            elif exp.op in (Op.ADD, Op.SUB, Op.MUL, Op.DIV, Op.MOD):
+                result = self._arithmetic(exp.op, lhs, rhs)
+            else:
+                result = self._compare(exp.op, lhs, rhs)
+
+        # SQL precedence: cast binds tightest, then `is [not] null`, then `not`
+        if exp.cast_to:
+            result = self._cast(result, exp.cast_to)
+        if exp.null_check:
+            is_null = exp.null_check == NullCheck.IS_NULL
+            result = Column(result.mask.copy() if is_null else ~result.mask)
+        if exp.negate:
+            result = Column(~result.data.astype(bool), result.mask)
+        return result
+
+    def _leaf(self, text: str, ctx: Context) -> Column:
+        if is_identifier(text):
+            qualifier, name = split_ref(text)
+            c = ctx.frame.lookup(qualifier, name)
+            if c is not None:
+                return c.take(ctx.first) if ctx.codes is not None else c
+            # Aliases never hide the columns of the dataset
+            if qualifier is None and name in ctx.aliases:
+                return ctx.aliases[name]
+
+        is_literal, value = parse_literal(text)
+        if not is_literal:
+            raise ValueError(f"Unknown column: {text}")
+        return _constant(value, ctx.n)
+
+    @staticmethod
+    def _compare(op: Op, lhs: Column, rhs: Column) -> Column:
+        a, b = lhs.data, rhs.data
+        data = {
+            Op.EQ: lambda: a == b,
+            Op.NEQ: lambda: a != b,
+            Op.LT: lambda: a < b,
+            Op.LEQ: lambda: a <= b,
+            Op.GT: lambda: a > b,
+            Op.GEQ: lambda: a >= b,
+        }[op]()
+        return Column(np.asarray(data, dtype=bool), lhs.mask | rhs.mask)
+
+    @staticmethod
+    def _logical(op: Op, lhs: Column, rhs: Column) -> Column:
+        a, b = lhs.data.astype(bool), rhs.data.astype(bool)
+        a_true, b_true = a & ~lhs.mask, b & ~rhs.mask
+        a_false, b_false = ~a & ~lhs.mask, ~b & ~rhs.mask
+        if op == Op.AND:
+            true, false = a_true & b_true, a_false | b_false
+        else:
+            true, false = a_true | b_true, a_false & b_false
+        return Column(true, ~(true | false))
+
+    @staticmethod
+    def _arithmetic(op: Op, lhs: Column, rhs: Column) -> Column:
+        a, b = lhs.data, rhs.data
+        mask = lhs.mask | rhs.mask
+        if op == Op.ADD:
+            return Column(a + b, mask)
+        if op == Op.SUB:
+            return Column(a - b, mask)
+        if op == Op.MUL:
+            return Column(a * b, mask)
+
+        zero = b == 0
+        safe = np.where(zero, 1, b)
+        integral = np.issubdtype(a.dtype, np.integer) and np.issubdtype(b.dtype, np.integer)
+        if op == Op.DIV:
+            if integral:
+                data = np.sign(a) * np.sign(safe) * (np.abs(a) // np.abs(safe))
+            else:
+                data = a / safe
+        else:
+            data = np.fmod(a, safe)
+        return Column(data, mask | zero)
+
+    @staticmethod
+    def _cast(c: Column, to: str) -> Column:
+        base = to.lower().split("(")[0].strip()
+        dtype = _CASTS.get(base)
+        if dtype is None:
+            raise NotImplementedError(f"Unsupported cast: {to}")
+
+        data = c.data
+        if dtype == "int64" and np.issubdtype(data.dtype, np.floating):
+            # Round half away from zero
+            data = np.trunc(data + np.copysign(0.5, data))
+        elif dtype == "int64" and data.dtype.kind in "US":
+            data = np.char.strip(data.astype(str))
+        elif dtype == "str" and data.dtype == bool:
+            return Column(np.where(data, "true", "false"), c.mask)
+        elif dtype == "bool" and data.dtype.kind in "US":
+            return Column(np.isin(np.char.lower(data.astype(str)), ["true", "t", "1"]), c.mask)
+
+        filled = np.where(c.mask, np.zeros(1, dtype=data.dtype)[0], data) if c.mask.any() else data
+        return Column(filled.astype(dtype), c.mask)
+
+    # Aggregates
+
+    def _aggregate(self, f: FuncExpr, ctx: Context) -> Column:
+        if ctx.codes is None:
+            raise ValueError(f"Aggregate outside of a grouped query: {f.to_string()}")
+
+        codes, g = ctx.codes, ctx.n_groups
+        arg = f.args[0] if f.args else "*"
+        if isinstance(arg, Expression) and is_leaf(arg):
+            arg = leaf_text(arg)
+        if arg == "*":
+            values = Column(np.zeros(len(codes)))
+        else:
+            values = self._eval(arg, ctx.row_context())
+
+        if f.distinct:
+            if f.f != FuncLabel.COUNT:
+                raise NotImplementedError(f"Unsupported distinct aggregate: {f.f.value}")
+            # Count each (group, value) pair once
+            valid = ~values.mask
+            pairs, _ = factorize([Column(codes[valid]), Column(values.data[valid])])
+            _, first = np.unique(pairs, return_index=True)
+            return Column(np.bincount(codes[valid][first], minlength=g))
+        return reduce_groups(f.f, values, codes, g)
+
+    # Windows
+
+    def _window(self, f: FuncExpr, ctx: Context) -> Column:
+        window = f.window
+        n = ctx.frame.n
+
+        partition = (
+            factorize([self._eval(window.partitionby, ctx)])[0]
+            if window.partitionby is not None
+            else np.zeros(n, dtype=np.int64)
+        )
+        order_key = (
+            sort_codes(self._eval(window.orderby, ctx), window.ordering, None)
+            if window.orderby is not None
+            else np.zeros(n, dtype=np.int64)
+        )
+
+        order = np.lexsort((order_key, partition))
+        sorted_partition, sorted_key = partition[order], order_key[order]
+        position = np.arange(n)
+
+        new_partition = np.ones(n, dtype=bool)
+        new_partition[1:] = sorted_partition[1:] != sorted_partition[:-1]
+        start = np.maximum.accumulate(np.where(new_partition, position, 0))
+
+        new_peer = new_partition.copy()
+        new_peer[1:] |= sorted_key[1:] != sorted_key[:-1]
+
+        label = f.f
+        if label == FuncLabel.ROW_NUMBER:
+            result = Column(position - start + 1)
+        elif label == FuncLabel.RANK:
+            peer_start = np.maximum.accumulate(np.where(new_peer, position, 0))
+            result = Column(peer_start - start + 1)
+        elif label == FuncLabel.DENSE_RANK:
+            peers = np.cumsum(new_peer)
+            result = Column(peers - peers[start] + 1)
+        elif label in (FuncLabel.LAG, FuncLabel.LEAD, FuncLabel.FIRST_VALUE, FuncLabel.LAST_VALUE):
+            values = self._eval(f.args[0], ctx).take(order)
+            if label in (FuncLabel.LAG, FuncLabel.LEAD):
+                offset = int(str(f.args[1])) if len(f.args) > 1 else 1
+                source = position - offset if label == FuncLabel.LAG else position + offset
+                inside = (source >= start) & (source < _partition_end(new_partition, n))
+                result = values.take(np.where(inside, source, -1))
+                if len(f.args) > 2:
+                    default = self._eval(f.args[2], ctx).take(order)
+                    result = Column(
+                        np.where(inside, result.data, default.data.astype(result.data.dtype)),
+                        np.where(inside, result.mask, default.mask),
+                    )
+            else:
+                end = _partition_end(new_partition, n)
+                lo = np.maximum(_frame_bound(window.rowsbetween_lhs, position, start, end), start)
+                hi = np.minimum(_frame_bound(window.rowsbetween_rhs, position, start, end), end - 1)
+                source = lo if label == FuncLabel.FIRST_VALUE else hi
+                # An empty frame has no value
+                result = values.take(np.where(lo <= hi, source, -1))
+        elif label.value in ("max", "min", "avg", "sum", "count"):
+            lb, ub = window.rowsbetween_lhs, window.rowsbetween_rhs
+            if (lb.value, ub.value) != ("unbounded preceding", "unbounded following"):
+                raise NotImplementedError(
+                    "Windowed aggregates are only supported over whole partitions."
+                )
+            values = self._eval(f.args[0], ctx)
+            reduced = reduce_groups(label, values, partition, int(partition.max()) + 1 if n else 0)
+            return reduced.take(partition)
+        else:
+            raise NotImplementedError(f"Unsupported window function: {label.value}")
+
+        # Scatter back from window order to row order
+        inverse = np.empty(n, dtype=np.int64)
+        inverse[order] = position
+        return result.take(inverse)
+
+
+def _frame_bound(spec, position, start, end):
+    """
+    For each sorted row, the position a frame bound falls on, before clipping to the partition.
+    """
+    if spec.value == "unbounded preceding":
+        return start
+    if spec.value == "unbounded following":
+        return end - 1
+    return position + (spec.offset or 0)
+
+
+def _partition_end(new_partition, n: int):
+    """
+    For each sorted row, the position one past the end of its partition.
+    """
+    starts = np.flatnonzero(new_partition)
+    ends = np.append(starts[1:], n)
+    return np.repeat(ends, np.diff(np.append(starts, n)))
+
+
+def reduce_groups(label: FuncLabel, values: Column, codes, g: int) -> Column:
+    """
+    Reduce a column to one value per group, ignoring nulls.
+    """
+    valid = ~values.mask
+    counts = np.bincount(codes[valid], minlength=g)
+    empty = counts == 0
+
+    if label == FuncLabel.COUNT:
+        return Column(counts)
+    if label not in (FuncLabel.SUM, FuncLabel.AVG, FuncLabel.MIN, FuncLabel.MAX):
+        raise NotImplementedError(f"Unsupported aggregate: {label.value}")
+
+    data = values.data[valid]
+    if label in (FuncLabel.SUM, FuncLabel.AVG):
+        dtype = np.int64 if np.issubdtype(data.dtype, np.integer) else np.float64
+        sums = np.zeros(g, dtype=dtype)
+        np.add.at(sums, codes[valid], data)
+        if label == FuncLabel.SUM:
+            return Column(sums, empty)
+        return Column(sums / np.where(empty, 1, counts), empty)
+
+    # min and max: sort by (group, value) and take the ends of each run
+    order = np.lexsort((data, codes[valid]))
+    sorted_codes = codes[valid][order]
+    pick = (
+        np.searchsorted(sorted_codes, np.arange(g), side="left")
+        if label == FuncLabel.MIN
+        else np.searchsorted(sorted_codes, np.arange(g), side="right") - 1
+    )
+    picked = np.full(g, -1, dtype=np.int64)
+    picked[~empty] = order[pick[~empty]]
+    return Column(data).take(picked)
+
+
+def execute(query: Query, tables: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Execute `query` against in-memory `tables`, a dict of `Entity.ref` to a dict of column arrays.
+    """
+    return Executor(tables).execute(query)
@@ -0,0 +1,296 @@
+import copy
+from typing import List, Optional, Set, Tuple, Union
+
+from spork.analysis import (
+    ColumnRef,
+    children,
+    column_refs,
+    conjuncts,
+    exp_str,
+    is_aggregate,
+    is_identifier,
+    is_leaf,
+    leaf_text,
+    output_name,
+    query_expressions,
+    split_ref,
+)
+from spork.entity import Entity
+from spork.expression import Expression
+from spork.func_expr import FuncExpr
+from spork.query import Join, Query
+from spork.stats import Statistics, cost, selectivity
+from spork.types import InclusionType, Op
+
+
+def optimize(query: Query, stats: Optional[Statistics] = None) -> Query:
+    """
+    Run all optimizer passes on a copy of `query`. Predicates are only reordered when
+    statistics are given.
+    """
+    query = prune_projections(eliminate_joins(query))
+    return order_predicates(query, stats) if stats is not None else query
+
+
+def eliminate_joins(query: Query) -> Query:
+    """
+    Return a copy of `query` without the left joins that cannot affect its result: joins on a
+    unique key of the joined entity or subquery whose columns are never referenced.
+
+    Uniqueness comes from `Entity.unique(...)`, or from the group by of a subquery.
+    """
+    query = copy.deepcopy(query)
+    _eliminate_joins(query)
+    return query
+
+
+def prune_projections(query: Query) -> Query:
+    """
+    Return a copy of `query` where joined subqueries only select the columns that are referenced
+    by the queries they are joined into. The outermost selection is left untouched.
+    """
+    query = copy.deepcopy(query)
+    _prune(query, None)
+    return query
+
+
+def _source_alias(what: Union[Entity, Query]) -> Optional[str]:
+    if isinstance(what, Entity):
+        return (what._alias or what.ref.split(".")[-1]).lower()
+    if isinstance(what, Query) and what._alias:
+        return what._alias.lower()
+    return None
+
+
+def _output_names(query: Query) -> Optional[Set[str]]:
+    """
+    The names a query exposes, or None if they cannot all be determined.
+    """
+    names = set()
+    for exp in query.selection.cols if query.selection else []:
+        name = output_name(exp)
+        if name is None or name == "*":
+            return None
+        names.add(name)
+    return names
+
+
+def _selection_aliases(query: Query) -> Set[str]:
+    cols = query.selection.cols if query.selection else []
+    return {exp._alias.lower() for exp in cols if exp._alias}
+
+
+def _unique_keys(what: Union[Entity, Query]) -> List[Tuple[str, ...]]:
+    if isinstance(what, Entity):
+        return what.unique_keys
+
+    if isinstance(what, Query) and what._group_by and what.selection:
+        # The group by of a subquery is unique, provided every grouping expression is selected
+        selected = {exp_str(exp): output_name(exp) for exp in what.selection.cols}
+        key = [selected.get(exp_str(exp)) for exp in what._group_by]
+        if all(key):
+            return [tuple(key)]
+    return []
+
+
+def _bound_columns(on, alias: str) -> Set[str]:
+    """
+    Columns of `alias` that the join condition equates with something not coming from `alias`.
+    """
+    bound = set()
+    for c in conjuncts(on):
+        if c.op != Op.EQ or c.negate or c.cast_to or c.null_check:
+            continue
+        for side, other in ((c.lhs, c.rhs), (c.rhs, c.lhs)):
+            if not (isinstance(side, Expression) and is_leaf(side)):
+                continue
+            text = leaf_text(side)
+            if not is_identifier(text):
+                continue
+            qualifier, name = split_ref(text)
+            if qualifier == alias and all(q != alias for q, _ in column_refs(other)):
+                bound.add(name)
+    return bound
+
+
+def _is_redundant(query: Query, join: Join) -> bool:
+    if join.how != InclusionType.LEFT:
+        return False
+
+    alias = _source_alias(join.what)
+    if alias is None:
+        return False
+
+    # At most one row may match each row on the left
+    bound = _bound_columns(join.on, alias)
+    if not any(key and set(key) <= bound for key in _unique_keys(join.what)):
+        return False
+
+    # ...and none of its columns may be used elsewhere. Bare names in order by, having and
+    # qualify may refer to selection aliases instead, whose expressions are checked themselves.
+    late = [query._having, query._qualify] + list(query._order_by or [])
+    late = [e for e in late if e is not None]
+    refs: Set[ColumnRef] = set()
+    late_refs: Set[ColumnRef] = set()
+    for exp in query_expressions(query, include_joins=False):
+        if any(exp is e for e in late):
+            late_refs |= column_refs(exp)
+        else:
+            refs |= column_refs(exp)
+    for other in query.dataset.joins:
+        if other is not join:
+            refs |= column_refs(other.on)
+
+    aliases = _selection_aliases(query)
+    refs |= {(q, n) for q, n in late_refs if q is not None or n not in aliases}
+
+    provided = _output_names(join.what) if isinstance(join.what, Query) else None
+    for qualifier, name in refs:
+        if qualifier == alias:
+            return False
+        if qualifier is None:
+            # A bare column might come from the joined source
+            if name == "*" or provided is None or name in provided:
+                return False
+    return True
+
+
+def _eliminate_joins(query: Query):
+    if not query.dataset:
+        return
+
+    for join in query.dataset.joins:
+        if isinstance(join.what, Query):
+            _eliminate_joins(join.what)
+
+    # Dropping a later join may free up an earlier one, so work backwards
+    for join in reversed(list(query.dataset.joins)):
+        if _is_redundant(query, join):
+            query.dataset.joins.remove(join)
+
+
+def _prune(query: Query, required: Optional[Set[str]]):
+    # Dropping columns of an ungrouped aggregate could leave no aggregates, changing the row count
+    cols = query.selection.cols if query.selection else []
+    aggregated = not query._group_by and any(is_aggregate(exp) for exp in cols)
+
+    if required is not None and cols and not aggregated:
+        # Columns used by the query's own clauses, e.g. `qualify rn = 1`, must stay
+        used = set(required)
+        for exp in query_expressions(query):
+            if exp not in query.selection.cols:
+                used |= {name for qualifier, name in column_refs(exp) if qualifier is None}
+
+        kept = [
+            exp
+            for exp in query.selection.cols
+            if output_name(exp) is None or output_name(exp) in used
+        ]
+        query.selection.cols = kept or query.selection.cols[:1]
+
+    if not query.dataset:
+        return
+
+    refs: Set[ColumnRef] = set()
+    for exp in query_expressions(query):
+        refs |= column_refs(exp)
+
+    for join in query.dataset.joins:
+        if not isinstance(join.what, Query):
+            continue
+        alias = _source_alias(join.what)
+        needed: Optional[Set[str]] = set()
+        for qualifier, name in refs:
+            if qualifier not in (None, alias):
+                continue
+            if name == "*" or alias is None:
+                needed = None
+                break
+            needed.add(name)
+        _prune(join.what, needed)
+
+
+def order_predicates(query: Query, stats: Statistics) -> Query:
+    """
+    Return a copy of `query` where the operands of `and`/`or` chains in where clauses and join
+    conditions are ordered cheapest and most decisive first, for engines that evaluate them in the
+    order written. Operands that may raise an error, such as divisions, are never moved ahead of
+    operands written before them, which may guard them.
+    """
+    query = copy.deepcopy(query)
+    _order_predicates(query, stats)
+    return query
+
+
+def _order_predicates(query: Query, stats: Statistics):
+    if query.dataset is None:
+        return
+
+    aliases = {}
+    for what in [query.dataset.entity] + [j.what for j in query.dataset.joins]:
+        if isinstance(what, Entity):
+            aliases[_source_alias(what)] = what.ref
+    stats = stats.with_aliases(aliases)
+
+    if query._where is not None:
+        query._where = _reorder(query._where, stats)
+    for join in query.dataset.joins:
+        join.on = _reorder(join.on, stats)
+        if isinstance(join.what, Query):
+            _order_predicates(join.what, stats)
+
+
+def _operands(exp: Expression, op: Op) -> List[Expression]:
+    """
+    Flatten a chain of `op`, e.g. `((a and b) and c)` into [a, b, c].
+    """
+    if exp.op != op or exp.negate or exp.cast_to or exp.null_check or exp._alias:
+        return [exp]
+    if not (isinstance(exp.lhs, Expression) and isinstance(exp.rhs, Expression)):
+        return [exp]
+    return _operands(exp.lhs, op) + _operands(exp.rhs, op)
+
+
+def _may_fail(exp) -> bool:
+    """
+    Whether evaluating an expression may raise an error: divisions, casts and function calls can.
+    """
+    if not isinstance(exp, Expression):
+        # Unparsed SQL text may hide any of these
+        return any(token in str(exp) for token in ("(", "/", "%", "::"))
+    if isinstance(exp, FuncExpr) or exp.cast_to or exp.op in (Op.DIV, Op.MOD):
+        return True
+    return any(_may_fail(c) for c in children(exp))
+
+
+def _reorder(exp: Expression, stats: Statistics) -> Expression:
+    if exp.op not in (Op.AND, Op.OR):
+        return exp
+
+    operands = _operands(exp, exp.op)
+    if len(operands) == 1:
+        # A negated or cast chain: only its insides can be reordered
+        exp.lhs, exp.rhs = _reorder(exp.lhs, stats), _reorder(exp.rhs, stats)
+        return exp
+
+    def rank(operand: Expression) -> float:
+        # Put first what most cheaply decides the result: false for `and`, true for `or`
+        s = selectivity(operand, stats)
+        decisive = 1 - s if exp.op == Op.AND else s
+        return cost(operand) / decisive if decisive > 0 else float("inf")
+
+    # Operands that may raise an error stay behind everything written before them, which may be
+    # guarding them, e.g. `x <> 0 and 100 / x > 5`
+    operands = [_reorder(o, stats) for o in operands]
+    ordered = []
+    while operands:
+        available = [o for i, o in enumerate(operands) if i == 0 or not _may_fail(o)]
+        best = min(available, key=rank)
+        ordered.append(best)
+        operands.remove(best)
+    operands = ordered
+
+    result = operands[0]
+    for operand in operands[1:]:
+        result = Expression(lhs=result, op=exp.op, rhs=operand)
+    return result
@@ -1,9 +1,12 @@
-from typing import Union, Optional, List
+from typing import TYPE_CHECKING, Any, Union, Optional, List, Tuple
 
 from spork.types import InclusionType, OrderingNulls
 from spork.expression import Expression
 from spork.entity import Entity
 
+if TYPE_CHECKING:
+    from spork.approx import ApproxReport
+
 
 class Selection:
     """
@@ -54,7 +57,12 @@ class Join:
         self.how = how if how else InclusionType.INNER
 
     def to_string(self) -> str:
-        return f"{self.how.value} join {self.what.to_string()} on {self.on.to_string()}"
+        what = (
+            f"({self.what.to_string()}) {self.what._alias}"
+            if isinstance(self.what, Query)
+            else self.what.to_string()
+        )
+        return f"{self.how.value} join {what} on {self.on.to_string()}"
 
 
 class Dataset:
@@ -101,6 +109,14 @@ class Query:
         self._order_by: Optional[List[Expression]] = None
         self._having: Optional[Expression] = None
         self._qualify: Optional[Expression] = None
+        self._alias = ""
+
+    def alias(self, _alias: str) -> "Query":
+        """
+        Set the alias the query is referred to by when used as a subquery.
+        """
+        self._alias = _alias
+        return self
 
     def select(self, selection: Selection) -> "Query":
         """
@@ -135,7 +151,10 @@ class Query:
         """
         Add an order by clause to the query.
         """
-        self._order_by = [Expression(exp) for exp in expressions]
+        self._order_by = [
+            exp if isinstance(exp, Expression) else Expression(exp)
+            for exp in expressions
+        ]
         return self
 
     def having(self, exp: Expression) -> "Query":
@@ -152,6 +171,28 @@ class Query:
         self._qualify = exp
         return self
 
+    def approximate(
+        self, fraction: Optional[float] = None, dialect: str = "snowflake"
+    ) -> Tuple["Query", "ApproxReport"]:
+        """
+        Return an approximate copy of the query reading a sample of its rows, and a report of the
+        error of each output column. See `spork.approx`.
+        """
+        from spork.approx import approximate
+
+        return approximate(self, fraction, dialect)
+
+    def to_canonical_string(
+        self, parametrize: bool = False, paramstyle: str = "qmark"
+    ) -> Tuple[str, List[Any]]:
+        """
+        Render the query canonically, so that equivalent queries render identically, optionally
+        lifting literals into parameters. Returns the SQL and the parameters. See `spork.canonical`.
+        """
+        from spork.canonical import canonicalize
+
+        return canonicalize(self, parametrize, paramstyle)
+
     def to_string(self) -> str:
         """
         Render the query as a SQL-compatible string.
@@ -177,9 +218,10 @@ class Query:
         if self._order_by:
             order_by_str = ", ".join(
                 [
-                    f"{exp.to_string()} {exp.ordering.value}"
-                    if exp.ordering is not None
-                    else f"{exp.to_string()}"
+                    " ".join(
+                        [exp.to_string()]
+                        + [o.value for o in (exp.ordering, exp.ordering_nulls) if o]
+                    )
                     for exp in self._order_by
                 ]
             )
@@ -0,0 +1,228 @@
+"""
+Priority scheduling with admission control for query execution.
+
+Queries wait in one queue per priority, and within a priority, per tenant: the most urgent
+priority is always served first, and its tenants take turns. A query is only started while the
+total weight of the queries in flight stays within a budget; a query heavier than the whole budget
+runs on its own. When the query at the front is too heavy to start, up to `backfill` smaller
+queries behind it may start ahead of it, after which nothing starts until it fits, so that it is
+not starved.
+
+Weights are static, computed from the shape of each `Query`: joins, window functions, unbounded
+window frames and joined subqueries make a query heavier.
+"""
+import queue
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional
+
+from spork.analysis import windows
+from spork.query import Query
+
+
+INTERACTIVE = 0
+NORMAL = 1
+BATCH = 2
+
+JOIN_WEIGHT = 1.0
+WINDOW_WEIGHT = 2.0
+# Per unbounded frame bound: unbounded following buffers whole partitions
+UNBOUNDED_WEIGHT = 1.0
+
+
+def query_weight(query: Query) -> float:
+    """
+    Static estimate of the cost of running `query`, starting at 1 for a plain scan.
+    """
+    weight = 1.0
+    if query.dataset:
+        for join in query.dataset.joins:
+            weight += JOIN_WEIGHT
+            if isinstance(join.what, Query):
+                weight += query_weight(join.what)
+
+    exps = list(query.selection.cols) if query.selection else []
+    if query._qualify is not None:
+        exps.append(query._qualify)
+    for w in (w for e in exps for w in windows(e)):
+        weight += WINDOW_WEIGHT
+        for bound in (w.rowsbetween_lhs, w.rowsbetween_rhs):
+            if bound.value and bound.value.startswith("unbounded"):
+                weight += UNBOUNDED_WEIGHT
+    return weight
+
+
+class _Job:
+    def __init__(self, sql: str, params: Any, weight: float):
+        self.sql = sql
+        self.params = params
+        self.weight = weight
+        self.future: Future = Future()
+
+
+class Scheduler:
+    """
+    Runs queries through `executor(sql, params)` on a pool of `workers` threads.
+
+    `max_queued` bounds the number of waiting queries: beyond it, `submit` blocks, or raises
+    `queue.Full` when not blocking or on timeout.
+    """
+
+    def __init__(
+        self,
+        executor: Callable[[str, Any], Any],
+        budget: float = 16.0,
+        workers: int = 8,
+        backfill: int = 4,
+        max_queued: Optional[int] = None,
+    ):
+        self.executor = executor
+        self.budget = budget
+        self.workers = workers
+        self.backfill = backfill
+        self.max_queued = max_queued
+
+        self._lock = threading.Condition()
+        self._queues: Dict[int, "OrderedDict[str, Deque[_Job]]"] = {}
+        self._queued = 0
+        self._running = 0
+        self._in_flight = 0.0
+        # Queries started ahead of the blocked front query
+        self._bypassed = 0
+        self._closed = False
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+
+    def submit(
+        self,
+        query: Query,
+        params: Any = None,
+        priority: int = NORMAL,
+        tenant: str = "default",
+        weight: Optional[float] = None,
+        block: bool = True,
+        timeout: Optional[float] = None,
+    ) -> Future:
+        """
+        Queue a query, returning a future of its result. Lower priorities are more urgent.
+        """
+        job = _Job(query.to_string(), params, query_weight(query) if weight is None else weight)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The scheduler has been shut down.")
+            if self.max_queued is not None and self._queued >= self.max_queued:
+                if not block or not self._lock.wait_for(
+                    lambda: self._queued < self.max_queued or self._closed, timeout
+                ):
+                    raise queue.Full()
+                if self._closed:
+                    raise RuntimeError("The scheduler has been shut down.")
+
+            tenants = self._queues.setdefault(priority, OrderedDict())
+            tenants.setdefault(tenant, deque()).append(job)
+            self._queued += 1
+            self._dispatch()
+        return job.future
+
+    def in_flight(self) -> float:
+        """
+        Total weight of the running queries.
+        """
+        with self._lock:
+            return self._in_flight
+
+    def queued(self) -> int:
+        with self._lock:
+            return self._queued
+
+    def _fits(self, job: _Job) -> bool:
+        return self._running == 0 or self._in_flight + job.weight <= self.budget
+
+    def _remove(self, priority: int, tenant: str, job: _Job) -> _Job:
+        tenants = self._queues[priority]
+        jobs = tenants[tenant]
+        jobs.remove(job)
+        if jobs:
+            # The tenant goes to the back of the line
+            tenants.move_to_end(tenant)
+        else:
+            del tenants[tenant]
+        if not tenants:
+            del self._queues[priority]
+        self._queued -= 1
+        self._lock.notify_all()
+        return job
+
+    def _next(self) -> Optional[_Job]:
+        """
+        The next query to start, if any may start now. Called with the lock held.
+        """
+        if self._running >= self.workers:
+            # Waiting queries stay in their queues rather than in the pool's
+            return None
+        blocked = False
+        for priority in sorted(self._queues):
+            for tenant in list(self._queues[priority]):
+                # Past the front query of a tenant only once blocked, i.e. when backfilling
+                for job in list(self._queues[priority][tenant]):
+                    if job.future.cancelled():
+                        self._remove(priority, tenant, job)
+                        return self._next()
+                    if self._fits(job):
+                        self._bypassed = self._bypassed + 1 if blocked else 0
+                        return self._remove(priority, tenant, job)
+                    if not blocked:
+                        if self._bypassed >= self.backfill:
+                            return None
+                        blocked = True
+        return None
+
+    def _dispatch(self):
+        while True:
+            job = self._next()
+            if job is None:
+                return
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            self._running += 1
+            self._in_flight += job.weight
+            self._pool.submit(self._run, job)
+
+    def _run(self, job: _Job):
+        try:
+            result = self.executor(job.sql, job.params)
+        except BaseException as e:
+            job.future.set_exception(e)
+        else:
+            job.future.set_result(result)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._in_flight -= job.weight
+                self._dispatch()
+                self._lock.notify_all()
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop accepting queries. With `wait`, queued queries are run to completion first; without,
+        they are cancelled.
+        """
+        with self._lock:
+            self._closed = True
+            if wait:
+                self._lock.wait_for(lambda: self._queued == 0 and self._running == 0)
+            else:
+                for tenants in self._queues.values():
+                    for jobs in tenants.values():
+                        for job in jobs:
+                            job.future.cancel()
+                self._queues.clear()
+                self._queued = 0
+            self._lock.notify_all()
+        self._pool.shutdown(wait=wait)
+
+    def __enter__(self) -> "Scheduler":
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
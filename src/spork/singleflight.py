@@ -0,0 +1,166 @@
+"""
+Request coalescing: concurrent executions of the same SQL share one in-flight backend call.
+
+Callers that arrive while a call for their key is running wait for it and receive its result - the
+same object, which should not be mutated - or its exception. Once the call completes, the next
+caller starts a new one; nothing is cached. Threads and asyncio tasks, on any event loop, coalesce
+with each other.
+
+Async calls run in a task of their own, which outlives the caller that started it being cancelled.
+A call that is itself cancelled or interrupted is not shared: its waiters start it again.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+from spork.query import Query
+
+
+class _Abandoned(Exception):
+    """
+    Published when a call is cancelled or interrupted: the waiters make the call anew rather than
+    share an interruption that was not theirs.
+    """
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        # Strong references to the running calls of `do_async`, which the event loop does not keep
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _join(self, key: Hashable) -> Tuple[Future, bool]:
+        """
+        The future of the in-flight call for `key`, and whether the caller has to make the call.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            return future, True
+
+    def _finish(
+        self,
+        key: Hashable,
+        future: Future,
+        result: Any = None,
+        error: Optional[BaseException] = None,
+    ):
+        with self._lock:
+            del self._calls[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Call `fn`, unless a call for `key` is already in flight, in which case wait for it instead.
+        """
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            try:
+                return future.result()
+            except _Abandoned:
+                continue
+
+        try:
+            result = fn()
+        except Exception as e:
+            self._finish(key, future, error=e)
+            raise
+        except BaseException:
+            self._finish(key, future, error=_Abandoned())
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await `fn()`, unless a call for `key` is already in flight, in which case await it instead.
+        """
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                # In a task of its own, so that the leader being cancelled does not cancel the call
+                task = asyncio.ensure_future(self._lead(key, future, fn))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            try:
+                # Shielded, so that a caller being cancelled does not cancel the call for everyone
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except _Abandoned:
+                continue
+
+    async def _lead(self, key: Hashable, future: Future, fn: Callable[[], Awaitable[Any]]):
+        try:
+            result = await fn()
+        except Exception as e:
+            self._finish(key, future, error=e)
+        except BaseException:
+            self._finish(key, future, error=_Abandoned())
+            raise
+        else:
+            self._finish(key, future, result)
+
+
+def _freeze(value: Any) -> Hashable:
+    """
+    A hashable equivalent of query parameters.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(v) for v in value)
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+class QueryCoalescer:
+    """
+    Executes queries through a backend, coalescing concurrent executions of the same rendered SQL
+    and parameters into one call.
+
+    `executor(sql, params)` is used by `execute`, and `async_executor(sql, params)` by
+    `execute_async`.
+    """
+
+    def __init__(
+        self,
+        executor: Optional[Callable[[str, Any], Any]] = None,
+        async_executor: Optional[Callable[[str, Any], Awaitable[Any]]] = None,
+    ):
+        self.executor = executor
+        self.async_executor = async_executor
+        self.flight = SingleFlight()
+
+    @staticmethod
+    def key(query: Query, params: Any = None) -> Hashable:
+        return query.to_string(), _freeze(params)
+
+    def execute(self, query: Query, params: Any = None) -> Any:
+        if self.executor is None:
+            raise ValueError("No executor configured.")
+        key = self.key(query, params)
+        return self.flight.do(key, lambda: self.executor(key[0], params))
+
+    async def execute_async(self, query: Query, params: Any = None) -> Any:
+        if self.async_executor is None:
+            raise ValueError("No async executor configured.")
+        key = self.key(query, params)
+        return await self.flight.do_async(key, lambda: self.async_executor(key[0], params))
@@ -36,3 +36,53 @@ def lag(
     if default_value is not None:
         args.append(lit(default_value))
     return FuncExpr(f=FuncLabel.LAG, args=args)
+
+
+def lead(
+        column: str, rows: Optional[int] = None, default_value: Optional[str] = None
+) -> FuncExpr:
+    """
+    Create a LEAD function expression.
+    """
+    args = [col(column)]
+    if rows is not None:
+        args.append(rows)
+    if default_value is not None:
+        args.append(lit(default_value))
+    return FuncExpr(f=FuncLabel.LEAD, args=args)
+
+
+def rank() -> FuncExpr:
+    return FuncExpr(f=FuncLabel.RANK)
+
+
+def dense_rank() -> FuncExpr:
+    return FuncExpr(f=FuncLabel.DENSE_RANK)
+
+
+def count(column: Any = "*") -> FuncExpr:
+    return FuncExpr(f=FuncLabel.COUNT, args=[col(column)])
+
+
+def count_distinct(column: Any) -> FuncExpr:
+    return FuncExpr(f=FuncLabel.COUNT, args=[col(column)], distinct=True)
+
+
+def sum(column: Any) -> FuncExpr:
+    return FuncExpr(f=FuncLabel.SUM, args=[col(column)])
+
+
+def avg(column: Any) -> FuncExpr:
+    return FuncExpr(f=FuncLabel.AVG, args=[col(column)])
+
+
+def min(column: Any) -> FuncExpr:
+    return FuncExpr(f=FuncLabel.MIN, args=[col(column)])
+
+
+def max(column: Any) -> FuncExpr:
+    return FuncExpr(f=FuncLabel.MAX, args=[col(column)])
+
+
+def median(column: Any) -> FuncExpr:
+    return FuncExpr(f=FuncLabel.MEDIAN, args=[col(column)])
@@ -0,0 +1,183 @@
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional
+
+from spork.analysis import (
+    children,
+    is_identifier,
+    is_leaf,
+    leaf_text,
+    parse_literal,
+    split_ref,
+)
+from spork.expression import Expression
+from spork.func_expr import FuncExpr
+from spork.types import NullCheck, Op
+
+
+# Selectivities assumed when nothing better is known
+DEFAULT_EQ = 0.1
+DEFAULT_RANGE = 1 / 3
+DEFAULT_BETWEEN = 0.25
+DEFAULT = 0.5
+
+
+class ColumnStats:
+    """
+    User-supplied statistics for one column.
+
+    `histogram` holds the boundaries of equi-depth buckets, in ascending order: with k + 1
+    boundaries, each of the k buckets holds the same share of the non-null rows.
+    """
+
+    def __init__(
+        self,
+        distinct: Optional[int] = None,
+        null_fraction: float = 0.0,
+        histogram: Optional[List[Any]] = None,
+    ):
+        self.distinct = distinct
+        self.null_fraction = null_fraction
+        self.histogram = histogram
+
+    def fraction_below(self, value: Any) -> Optional[float]:
+        """
+        Estimated share of non-null values below `value`, if a histogram is available.
+        """
+        h = self.histogram
+        if not h or len(h) < 2:
+            return None
+        try:
+            if value <= h[0]:
+                return 0.0
+            if value >= h[-1]:
+                return 1.0
+            i = bisect_right(h, value) - 1
+            lo, hi = h[i], h[i + 1]
+            within = (value - lo) / (hi - lo) if hi != lo else 0.0
+        except TypeError:
+            # Not comparable, or not numeric: without interpolation, assume half a bucket
+            try:
+                i = bisect_right(h, value) - 1
+            except TypeError:
+                return None
+            within = 0.5
+        return (i + within) / (len(h) - 1)
+
+
+class Statistics:
+    """
+    Column statistics keyed by `table.column` (using the entity ref or alias) or bare column name.
+    """
+
+    def __init__(self, columns: Dict[str, ColumnStats], aliases: Optional[Dict[str, str]] = None):
+        self.columns = {k.lower(): v for k, v in columns.items()}
+        # Alias -> entity ref, to find statistics of aliased references
+        self.aliases = {k.lower(): v.lower() for k, v in (aliases or {}).items()}
+
+    def with_aliases(self, aliases: Dict[str, str]) -> "Statistics":
+        return Statistics(self.columns, {**self.aliases, **aliases})
+
+    def lookup(self, exp: Any) -> Optional[ColumnStats]:
+        if isinstance(exp, Expression):
+            if not is_leaf(exp):
+                return None
+            exp = leaf_text(exp)
+        if not isinstance(exp, str) or not is_identifier(exp):
+            return None
+
+        qualifier, name = split_ref(exp)
+        candidates = [exp.lower()]
+        if qualifier in self.aliases:
+            candidates.append(f"{self.aliases[qualifier]}.{name}")
+        candidates.append(name)
+        for key in candidates:
+            if key in self.columns:
+                return self.columns[key]
+        return None
+
+
+def _literal(exp: Any) -> Optional[Any]:
+    text = leaf_text(exp) if isinstance(exp, Expression) and is_leaf(exp) else exp
+    if not isinstance(text, str):
+        return None
+    is_literal, value = parse_literal(text)
+    return value if is_literal else None
+
+
+def _comparison(op: Op, column: ColumnStats, value: Any) -> float:
+    non_null = 1 - column.null_fraction
+    if op == Op.EQ:
+        return non_null / column.distinct if column.distinct else DEFAULT_EQ
+    if op == Op.NEQ:
+        return non_null * (1 - 1 / column.distinct) if column.distinct else 1 - DEFAULT_EQ
+
+    below = column.fraction_below(value) if value is not None else None
+    if below is None:
+        return DEFAULT_RANGE
+    return non_null * (below if op in (Op.LT, Op.LEQ) else 1 - below)
+
+
+_FLIPPED = {Op.LT: Op.GT, Op.LEQ: Op.GEQ, Op.GT: Op.LT, Op.GEQ: Op.LEQ, Op.EQ: Op.EQ, Op.NEQ: Op.NEQ}
+
+
+def selectivity(exp: Expression, stats: Statistics) -> float:
+    """
+    Estimated fraction of rows for which `exp` is true.
+    """
+    if exp.null_check:
+        column = stats.lookup(exp.lhs) if exp.op is None else None
+        nf = column.null_fraction if column else DEFAULT_EQ
+        s = nf if exp.null_check == NullCheck.IS_NULL else 1 - nf
+    elif exp.op == Op.AND:
+        s = selectivity(exp.lhs, stats) * selectivity(exp.rhs, stats)
+    elif exp.op == Op.OR:
+        a, b = selectivity(exp.lhs, stats), selectivity(exp.rhs, stats)
+        s = a + b - a * b
+    elif exp.op in _FLIPPED:
+        s = _binary_selectivity(exp, stats)
+    elif exp.op == Op.BETWEEN:
+        column = stats.lookup(exp.lhs)
+        s = DEFAULT_BETWEEN
+        if column and exp.bounds:
+            lo, hi = (column.fraction_below(_literal(b)) for b in exp.bounds)
+            if lo is not None and hi is not None:
+                s = (1 - column.null_fraction) * max(hi - lo, 0.0)
+    elif exp.op is None and isinstance(exp.lhs, Expression):
+        s = selectivity(exp.lhs, stats)
+    else:
+        s = DEFAULT
+
+    return 1 - s if exp.negate else s
+
+
+def _binary_selectivity(exp: Expression, stats: Statistics) -> float:
+    lhs, rhs = stats.lookup(exp.lhs), stats.lookup(exp.rhs)
+    if lhs and rhs and exp.op == Op.EQ:
+        # A join-style equality
+        distinct = max(lhs.distinct or 0, rhs.distinct or 0)
+        non_null = (1 - lhs.null_fraction) * (1 - rhs.null_fraction)
+        return non_null / distinct if distinct else DEFAULT_EQ
+    if lhs:
+        return _comparison(exp.op, lhs, _literal(exp.rhs))
+    if rhs:
+        return _comparison(_FLIPPED[exp.op], rhs, _literal(exp.lhs))
+    return DEFAULT_EQ if exp.op == Op.EQ else DEFAULT_RANGE
+
+
+def cost(exp: Any) -> float:
+    """
+    Relative cost of evaluating an expression once: operators are cheap, casts and function calls
+    are not.
+    """
+    if not isinstance(exp, Expression):
+        # Unparsed SQL text may hide function calls
+        return 20.0 if "(" in str(exp) else 0.0
+
+    total = 1.0 if exp.op is not None else 0.0
+    if isinstance(exp, FuncExpr):
+        total += 20.0
+    if exp.cast_to:
+        total += 5.0
+    if exp.null_check or exp.negate:
+        total += 0.5
+    return total + sum(cost(c) for c in children(exp))
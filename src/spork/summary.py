@@ -0,0 +1,211 @@
+"""
+Answering queries from pre-aggregated summary tables (materialized views).
+
+A summary is an `Entity` together with the `Query` it was materialized from. A query can be
+answered from a summary when:
+
+- both read the same dataset,
+- every condition of the summary's where clause also appears in the query's where clause (the
+  remaining conditions may only use the summary's group by columns),
+- the query groups by a subset of the summary's group by columns, and
+- every aggregate of the query can be recomputed from the summary's aggregates: sums and counts
+  are summed, minimums and maximums re-minimized and re-maximized, and averages divided out of a
+  sum and a count.
+
+Implication of where clauses is checked syntactically, condition by condition.
+"""
+from typing import Dict, List, Optional, Tuple
+
+from spork.analysis import (
+    AGGREGATES,
+    column_refs,
+    conjuncts,
+    exp_str,
+    is_aggregate,
+    is_identifier,
+    is_leaf,
+    leaf_text,
+    transform,
+)
+from spork.entity import Entity
+from spork.expression import Expression
+from spork.func_expr import FuncExpr
+from spork.query import Dataset, Query, Selection
+from spork.types import FuncLabel, Op
+
+
+class _NoMatch(Exception):
+    pass
+
+
+def _name(exp: Expression) -> Optional[str]:
+    """
+    The name a selected expression is exposed under, in its original case.
+    """
+    if exp._alias:
+        return exp._alias
+    if is_leaf(exp) and is_identifier(leaf_text(exp)):
+        return leaf_text(exp).split(".")[-1]
+    return None
+
+
+def _carry(original: Expression, replacement: Expression) -> Expression:
+    replacement.ordering = original.ordering
+    replacement.ordering_nulls = original.ordering_nulls
+    return replacement
+
+
+class Summary:
+    """
+    A pre-aggregated table and the query it holds the result of.
+    """
+
+    def __init__(self, entity: Entity, definition: Query):
+        if not definition.selection or not definition.dataset or not definition._group_by:
+            raise ValueError("A summary must be an aggregate query with a group by.")
+        if definition._having is not None or definition._qualify is not None:
+            raise ValueError("A summary cannot have a having or qualify clause.")
+
+        self.entity = entity
+        self.definition = definition
+        self.qualifier = entity._alias or entity.ref.split(".")[-1]
+
+        # Group by expressions and aggregates, to the summary column holding them
+        group_by = {exp_str(exp) for exp in definition._group_by}
+        self.dimensions: Dict[str, str] = {}
+        self.aggregates: Dict[Tuple[FuncLabel, str], str] = {}
+        for exp in definition.selection.cols:
+            name = _name(exp)
+            if name is None:
+                continue
+            if exp_str(exp) in group_by:
+                self.dimensions[exp_str(exp)] = name
+            elif (
+                isinstance(exp, FuncExpr)
+                and exp.window is None
+                and not exp.distinct
+                and exp.f.value in ("sum", "count", "min", "max")
+                and len(exp.args) == 1
+            ):
+                self.aggregates[(exp.f, _arg_str(exp.args[0]))] = name
+
+        self.conditions = {exp_str(c) for c in conjuncts(definition._where)}
+
+    def column(self, name: str) -> Expression:
+        return Expression(f"{self.qualifier}.{name}")
+
+    def rewrite(self, query: Query) -> Optional[Query]:
+        """
+        Rewrite `query` to read from this summary, or return None if it cannot be.
+        """
+        if not query.selection or not query.dataset or query._qualify is not None:
+            return None
+        if query.dataset.to_string() != self.definition.dataset.to_string():
+            return None
+
+        grouped = bool(query._group_by) or any(is_aggregate(e) for e in query.selection.cols)
+        if not grouped:
+            # Summary rows are groups, not the rows of the underlying dataset
+            return None
+
+        where = conjuncts(query._where)
+        if not self.conditions <= {exp_str(c) for c in where}:
+            return None
+        residual = [c for c in where if exp_str(c) not in self.conditions]
+
+        aliases = {e._alias.lower() for e in query.selection.cols if e._alias}
+        try:
+            cols = []
+            for exp in query.selection.cols:
+                rewritten = self._rewrite(exp, set(), not query._group_by)
+                name = _name(exp)
+                if name is not None and _name(rewritten) != name:
+                    rewritten.alias(name)
+                cols.append(rewritten)
+
+            result = Query(Selection(*cols), Dataset(self.entity))
+            if residual:
+                where_exp = self._rewrite(residual[0], set(), False)
+                for c in residual[1:]:
+                    where_exp = where_exp & self._rewrite(c, set(), False)
+                result.where(where_exp)
+            if query._group_by:
+                result.group_by(*[self._rewrite(e, set(), False) for e in query._group_by])
+            if query._having is not None:
+                result.having(self._rewrite(query._having, aliases, not query._group_by))
+            if query._order_by:
+                result.order_by(*[self._rewrite(e, aliases, False) for e in query._order_by])
+        except _NoMatch:
+            return None
+        return result
+
+    def _rewrite(self, exp: Expression, aliases: set, ungrouped: bool) -> Expression:
+        def fn(node):
+            if isinstance(node, str):
+                refs = column_refs(node)
+                if any(q is not None or n not in aliases for q, n in refs):
+                    # A column that the summary does not group by
+                    raise _NoMatch()
+                return None
+
+            key = exp_str(node)
+            if key in self.dimensions:
+                return _carry(node, self.column(self.dimensions[key]))
+            if isinstance(node, FuncExpr) and node.window is None and node.f.value in AGGREGATES:
+                return _carry(node, self._reaggregate(node, ungrouped))
+            return None
+
+        rewritten = transform(exp, fn)
+        rewritten._alias = exp._alias
+        return rewritten
+
+    def _reaggregate(self, f: FuncExpr, ungrouped: bool) -> Expression:
+        if len(f.args) != 1 or f.distinct:
+            raise _NoMatch()
+        arg = _arg_str(f.args[0])
+
+        def stored(label: FuncLabel) -> Expression:
+            name = self.aggregates.get((label, arg))
+            if name is None:
+                raise _NoMatch()
+            return self.column(name)
+
+        if f.f in (FuncLabel.SUM, FuncLabel.MIN, FuncLabel.MAX):
+            return FuncExpr(f=f.f, args=[stored(f.f)])
+        if f.f == FuncLabel.COUNT:
+            total = FuncExpr(f=FuncLabel.SUM, args=[stored(FuncLabel.COUNT)])
+            # Without a group by, a count over no rows is 0, where a sum is null
+            return Expression(f"coalesce({total.to_string()}, 0)") if ungrouped else total
+        if f.f == FuncLabel.AVG:
+            total = Expression(FuncExpr(f=FuncLabel.SUM, args=[stored(FuncLabel.SUM)])).cast("decimal")
+            count = FuncExpr(f=FuncLabel.SUM, args=[stored(FuncLabel.COUNT)])
+            return Expression(lhs=total, op=Op.DIV, rhs=count)
+        raise _NoMatch()
+
+
+def _arg_str(arg) -> str:
+    return exp_str(arg) if isinstance(arg, Expression) else str(arg)
+
+
+class SummaryRegistry:
+    """
+    A set of summaries that queries are rewritten against.
+    """
+
+    def __init__(self):
+        self.summaries: List[Summary] = []
+
+    def register(self, entity: Entity, definition: Query) -> "SummaryRegistry":
+        self.summaries.append(Summary(entity, definition))
+        return self
+
+    def rewrite(self, query: Query) -> Query:
+        """
+        Rewrite `query` against the most aggregated summary that can answer it, or return it
+        unchanged if none can.
+        """
+        for summary in sorted(self.summaries, key=lambda s: len(s.dimensions)):
+            rewritten = summary.rewrite(query)
+            if rewritten is not None:
+                return rewritten
+        return query
@@ -44,6 +44,9 @@ class FuncLabel(Enum):
     MAX = "max"
     MIN = "min"
     AVG = "avg"
+    SUM = "sum"
+    COUNT = "count"
+    MEDIAN = "median"
     RANK = "rank"
     DENSE_RANK = "dense_rank"
     FIRST_VALUE = "first_value"
@@ -0,0 +1,73 @@
+import unittest
+
+from spork import col, lit, row_number, Selection, Dataset, Join, Query, Entity, Window
+from spork.advisor import advise, verify
+from spork.harness import Table, integers, serial, text
+from spork.stats import ColumnStats, Statistics
+
+
+TABLES = [
+    Table("Fact", 20000, {"Id": serial(), "DimId": integers(1, 200), "Day": integers(1, 365), "Amount": integers(0, 100)}),
+    Table("Dim", 200, {"Id": serial(), "Name": text(50)}),
+]
+
+
+def fact() -> Entity:
+    return Entity("Fact").alias("f")
+
+
+class TestAdvisor(unittest.TestCase):
+    def test_equality_then_range(self):
+        q = Query(Selection("f.Amount"), Dataset(fact())).where(
+            col("f.DimId").eq(lit(3)) & (col("f.Day") > lit(100))
+        )
+        (best, *_) = advise([q])
+        self.assertEqual(("Fact", ("DimId", "Day")), (best.table, best.columns))
+        self.assertEqual([0], best.queries)
+        self.assertEqual("create index ix_Fact_DimId_Day on Fact (DimId, Day)", best.create_sql())
+
+    def test_join_and_order(self):
+        q = (
+            Query(
+                Selection("f.Amount", "d.Name"),
+                Dataset(fact(), Join(Entity("Dim").alias("d"), col("d.Id").eq(col("f.DimId")))),
+            )
+            .where(col("d.Name").eq(lit("'v1'")))
+            .order_by("f.Day")
+        )
+        proposals = {(p.table, frozenset(p.columns)) for p in advise([q])}
+        # The join key is an equality on both sides
+        self.assertIn(("Dim", frozenset(["Name", "Id"])), proposals)
+        self.assertIn(("Fact", frozenset(["DimId", "Day"])), proposals)
+
+    def test_window_keys(self):
+        q = Query(
+            Selection("Id", row_number().over(Window().partition_by("DimId").order_by("Day"))),
+            Dataset(Entity("Fact")),
+        )
+        self.assertEqual([("Fact", ("DimId", "Day"))], [(p.table, p.columns) for p in advise([q])])
+
+    def test_ranking(self):
+        by_day = Query(Selection("Id"), Dataset(Entity("Fact"))).where(col("Day").eq(lit(7)))
+        by_dim = Query(Selection("Id"), Dataset(Entity("Fact"))).where(col("DimId").eq(lit(7)))
+
+        # More frequent queries weigh more
+        self.assertEqual(("Day",), advise([(by_day, 10.0), by_dim])[0].columns)
+
+        # And so do more selective predicates
+        stats = Statistics({"Fact.Day": ColumnStats(distinct=365), "Fact.DimId": ColumnStats(distinct=2)})
+        self.assertEqual(("Day",), advise([by_day, by_dim], stats)[0].columns)
+
+        # Existing indexes are not proposed again
+        self.assertEqual([("DimId",)], [p.columns for p in advise([by_day, by_dim], existing={"Fact": [("Day", "Id")]})])
+
+    def test_verify(self):
+        q = Query(Selection("Amount"), Dataset(Entity("Fact"))).where(col("DimId").eq(lit(3)))
+        proposals = advise([q])
+        (result,) = verify(proposals, [q], TABLES, repeat=1)
+        self.assertTrue(result.used)
+        self.assertFalse(any(result.proposal.name in line for s in result.before for line in s.plan))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+from spork import col, count, count_distinct, sum, median, Selection, Dataset, Join, Query, Entity
+from spork.approx import Estimate
+
+
+class TestApprox(unittest.TestCase):
+    def setUp(self):
+        self.query = Query(
+            Selection(
+                "s.Region",
+                count().alias("n"),
+                sum("s.Amount").alias("total"),
+                count_distinct("s.UserId").alias("users"),
+                median("s.Amount").alias("med"),
+            ),
+            Dataset(Entity("Sales").alias("s"), Join(Entity("Dim").alias("d"), col("d.Id").eq(col("s.DimId")))),
+        ).group_by("s.Region")
+
+    def test_sampled(self):
+        q, report = self.query.approximate(0.1, "postgres")
+        self.assertEqual(
+            "select\n"
+            "s.Region,\n"
+            "(count(*) * 10) as n,\n"
+            "sqrt((1 - 0.1) * count(*)) / 0.1 as n_stderr,\n"
+            "(sum(s.Amount) * 10) as total,\n"
+            "sqrt((1 - 0.1) * sum(s.Amount * s.Amount)) / 0.1 as total_stderr,\n"
+            "count(distinct s.UserId) as users,\n"
+            "percentile_cont(0.5) within group (order by s.Amount) as med\n"
+            "from Sales s tablesample bernoulli (10)\n"
+            "inner join Dim d on (d.Id = s.DimId)\n"
+            "group by s.Region",
+            q.to_string(),
+        )
+        self.assertEqual(
+            [Estimate.EXACT, Estimate.SCALED, Estimate.SCALED, Estimate.SKETCH, Estimate.SKETCH],
+            [e.method for e in report.estimates],
+        )
+        self.assertEqual("n_stderr", report.estimates[1].stderr_column)
+
+        # The original query is untouched
+        self.assertNotIn("tablesample", self.query.to_string())
+
+    def test_sketches_only(self):
+        q, report = self.query.approximate(dialect="spark")
+        cols = [c.to_string() for c in q.selection.cols]
+        self.assertIn("approx_count_distinct(s.UserId) as users", cols)
+        self.assertIn("percentile_approx(s.Amount, 0.5) as med", cols)
+        self.assertIn("count(*) as n", cols)
+        self.assertEqual(0.05, report.estimates[3].relative_error)
+
+    def test_unsupported_sampling(self):
+        with self.assertRaises(ValueError):
+            self.query.approximate(0.1, "sqlite")
+        # Nor has it a percentile function to compute the median with
+        with self.assertRaises(ValueError):
+            self.query.approximate(dialect="sqlite")
+
+
+if __name__ == "__main__":
+    unittest.main()
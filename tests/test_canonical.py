@@ -0,0 +1,152 @@
+import unittest
+
+from spork import col, lit, count, sum, Selection, Dataset, Join, Query, Entity
+from spork.canonical import canonicalize
+
+
+class TestCanonical(unittest.TestCase):
+    def test_expression(self):
+        a = col("x").eq(lit(1)) & (col("y") > col("z")) & (col("b") + col("a") >= lit(2))
+        b = (lit(2) <= col("a") + col("b")) & (col("z") < col("y")) & lit(1).eq(col("x"))
+        self.assertEqual(a.to_canonical_string(), b.to_canonical_string())
+        self.assertEqual(
+            "((1 = x) and (2 <= (a + b)) and (z < y))", a.to_canonical_string()
+        )
+
+        # Non-commutative operators keep their operand order
+        self.assertNotEqual(
+            (col("a") - col("b")).to_canonical_string(),
+            (col("b") - col("a")).to_canonical_string(),
+        )
+
+    def test_equivalent_queries(self):
+        a = (
+            Query(
+                Selection("s.Region", sum("s.Amount").alias("Total")),
+                Dataset(
+                    Entity("Sales").alias("s"),
+                    Join(Entity("Region").alias("r"), col("r.Id").eq(col("s.RegionId"))),
+                    Join(Entity("Product").alias("p"), col("s.ProductId").eq(col("p.Id"))),
+                ),
+            )
+            .where((col("s.Day") > lit("'2024-01-01'")) & col("p.Kind").eq(lit("'a'")))
+            .group_by("s.Region", "p.Kind")
+            .order_by(col("Total").desc())
+        )
+        b = (
+            Query(
+                Selection("sales.Region", sum("sales.Amount").alias("Total")),
+                Dataset(
+                    Entity("Sales").alias("sales"),
+                    Join(Entity("Product").alias("prod"), col("prod.Id").eq(col("sales.ProductId"))),
+                    Join(Entity("Region").alias("reg"), col("sales.RegionId").eq(col("reg.Id"))),
+                ),
+            )
+            .where(lit("'a'").eq(col("prod.Kind")) & (lit("'2024-01-01'") < col("sales.Day")))
+            .group_by("prod.Kind", "sales.Region")
+            .order_by(col("Total").desc())
+        )
+
+        sql, params = canonicalize(a)
+        self.assertEqual((sql, params), canonicalize(b))
+        self.assertEqual([], params)
+        self.assertEqual(
+            "select t0.Region, sum(t0.Amount) as Total from Sales t0 "
+            "inner join Product t1 on t0.ProductId = t1.Id "
+            "inner join Region t2 on t0.RegionId = t2.Id "
+            "where ('2024-01-01' < t0.Day) and ('a' = t1.Kind) "
+            "group by t0.Region, t1.Kind order by Total desc",
+            sql,
+        )
+
+    def test_join_dependencies(self):
+        # Bridge references Zone, so it cannot be joined before it
+        q = Query(
+            Selection("a.Id"),
+            Dataset(
+                Entity("A").alias("a"),
+                Join(Entity("Zone").alias("z"), col("z.Id").eq(col("a.ZoneId"))),
+                Join(Entity("Bridge").alias("b"), col("b.ZoneId").eq(col("z.Id"))),
+            ),
+        )
+        sql, _ = canonicalize(q)
+        self.assertLess(sql.index("join Zone"), sql.index("join Bridge"))
+
+        # Outer joins stay where they are
+        q = Query(
+            Selection("a.Id"),
+            Dataset(
+                Entity("A").alias("a"),
+                Join(Entity("Zone").alias("z"), col("z.Id").eq(col("a.ZoneId")), "left"),
+                Join(Entity("Bridge").alias("b"), col("b.Id").eq(col("a.BridgeId"))),
+            ),
+        )
+        sql, _ = canonicalize(q)
+        self.assertLess(sql.index("join Zone"), sql.index("join Bridge"))
+
+    def test_parametrize(self):
+        def query(day: str, kind: str) -> Query:
+            return (
+                Query(Selection("s.Id", lit(1).alias("One")), Dataset(Entity("Sales").alias("s")))
+                .where(col("s.Day").between(lit(day), lit("'2024-12-31'")) & col("s.Kind").eq(lit(kind)))
+                .having(count() > lit(5))
+            )
+
+        sql, params = canonicalize(query("'2024-01-01'", "'a'"), parametrize=True)
+        self.assertEqual(
+            "select t0.Id, 1 as One from Sales t0 "
+            "where (? = t0.Kind) and (t0.Day between ? and ?) having ? < count(*)",
+            sql,
+        )
+        self.assertEqual(["a", "2024-01-01", "2024-12-31", 5], params)
+
+        other, _ = canonicalize(query("'2023-01-01'", "'b'"), parametrize=True)
+        self.assertEqual(sql, other)
+
+        sql, _ = canonicalize(query("'2024-01-01'", "'a'"), parametrize=True, paramstyle="dollar")
+        self.assertIn("$1 = t0.Kind", sql)
+        self.assertIn("having $4 < count(*)", sql)
+
+    def test_mixed_parameter_types(self):
+        q = Query(Selection("a.Id"), Dataset(Entity("A").alias("a"))).where(
+            col("a.x").eq(lit(1)) | col("a.x").eq(lit("'y'"))
+        ).group_by("a.Id")
+        sql, params = canonicalize(q, parametrize=True)
+        self.assertEqual(
+            "select t0.Id from A t0 where (? = t0.x) or (? = t0.x) group by t0.Id", sql
+        )
+        self.assertEqual([1, "y"], params)
+
+    def test_schema_qualified_entity(self):
+        q = Query(
+            Selection("db.Sales.Amount", col("db.Sales.Amount * 2").alias("Double")),
+            Dataset(Entity("db.Sales")),
+        ).where(col("db.Sales.Id").eq(lit(1)))
+        self.assertEqual(
+            "select t0.Amount, t0.Amount * 2 as Double from db.Sales t0 where 1 = t0.Id",
+            q.to_canonical_string()[0],
+        )
+
+    def test_subquery(self):
+        sub = (
+            Query(Selection("o.CustomerId", count().alias("n")), Dataset(Entity("Orders").alias("o")))
+            .group_by("o.CustomerId")
+            .alias("orders")
+        )
+        q = Query(
+            Selection("c.Name", "orders.n"),
+            Dataset(
+                Entity("Customer").alias("c"),
+                Join(sub, col("orders.CustomerId").eq(col("c.Id")), "left"),
+            ),
+        )
+        self.assertEqual(
+            "select t0.Name, t1.n from Customer t0 left join "
+            "(select t0.CustomerId, count(*) as n from Orders t0 group by t0.CustomerId) t1 "
+            "on t0.Id = t1.CustomerId",
+            q.to_canonical_string()[0],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import sqlite3
+import threading
+import unittest
+
+from spork import col, sum, Selection, Dataset, Join, Query, Entity
+from spork.dag import Pipeline
+
+
+class SQLite:
+    """
+    Runs every statement on one shared connection, so that temporary tables are visible.
+    """
+
+    def __init__(self):
+        self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self.conn.execute("create table Sales (Id, Region, Amount)")
+        self.conn.executemany(
+            "insert into Sales values (?, ?, ?)", [(i, f"r{i % 3}", i) for i in range(30)]
+        )
+        self.lock = threading.Lock()
+        self.statements = []
+
+    def __call__(self, sql, params):
+        with self.lock:
+            self.statements.append(sql)
+            if sql.startswith("create table "):
+                self.conn.execute(f"drop table if exists {sql.split()[2]}")
+            return self.conn.execute(sql).fetchall()
+
+
+def by_region() -> Query:
+    return (
+        Query(Selection("s.Region", sum("s.Amount").alias("Total")), Dataset(Entity("Sales").alias("s")))
+        .group_by("s.Region")
+        .alias("r")
+    )
+
+
+def pipeline() -> Pipeline:
+    p = Pipeline(persistent="create table {name} as {sql}")
+    regions = p.add("by_region", by_region())
+    for name, region in (("first", "'r0'"), ("second", "'r1'")):
+        p.add(
+            name,
+            Query(
+                Selection("r.Total"),
+                Dataset(Entity("Sales").alias("s"), Join(regions, col("r.Region").eq(col("s.Region")))),
+            ).where(col("s.Region").eq(region)),
+        )
+    p.add("summary", by_region(), output="RegionSummary")
+    p.add("report", Query(Selection("max(Total)"), Dataset(Entity("RegionSummary"))))
+    return p
+
+
+class TestDag(unittest.TestCase):
+    def test_dependencies(self):
+        p = pipeline()
+        self.assertEqual(
+            {
+                "by_region": set(),
+                "first": {"by_region"},
+                "second": {"by_region"},
+                "summary": set(),
+                "report": {"summary"},
+            },
+            p.dependencies(),
+        )
+        order = p.order()
+        self.assertLess(order.index("by_region"), order.index("first"))
+        self.assertLess(order.index("summary"), order.index("report"))
+
+        # Shared queries are read from their table, not inlined
+        self.assertIn("join tmp_by_region r on", p.sql("first"))
+
+    def test_run(self):
+        db = SQLite()
+        report = pipeline().run(db, versions={"Sales": 1})
+
+        self.assertEqual([(135,)] * 10, report.results["first"])
+        self.assertEqual([(145,)] * 10, report.results["second"])
+        self.assertEqual([(155,)], report.results["report"])
+        self.assertNotIn("by_region", report.results)
+        self.assertEqual([], report.skipped)
+
+        # Materialized once, and dropped afterwards
+        creates = [s for s in db.statements if s.startswith("create temporary table tmp_by_region")]
+        self.assertEqual(1, len(creates))
+        self.assertIn("drop table if exists tmp_by_region", db.statements)
+
+        path = report.critical_path
+        self.assertIn(path, [["by_region", "first"], ["by_region", "second"], ["summary", "report"]])
+        self.assertGreater(report.critical_seconds, 0)
+
+    def test_cleanup_after_failure(self):
+        db = SQLite()
+
+        def executor(sql, params):
+            if sql.startswith("create temporary table"):
+                db.statements.append(sql)
+                raise sqlite3.OperationalError("disk full")
+            return db(sql, params)
+
+        with self.assertRaises(sqlite3.OperationalError):
+            pipeline().run(executor)
+        # The create may have left a table behind
+        self.assertIn("drop table if exists tmp_by_region", db.statements)
+
+    def test_skip_unchanged(self):
+        db = SQLite()
+        first = pipeline().run(db, versions={"Sales": 1})
+
+        second = pipeline().run(db, state=first.fingerprints, versions={"Sales": 1})
+        self.assertEqual(["summary"], second.skipped)
+        self.assertEqual([(155,)], second.results["report"])
+
+        third = pipeline().run(db, state=second.fingerprints, versions={"Sales": 2})
+        self.assertEqual([], third.skipped)
+
+    def test_cycle(self):
+        p = Pipeline()
+        p.add("a", Query(Selection("x"), Dataset(Entity("B"))), output="A")
+        p.add("b", Query(Selection("x"), Dataset(Entity("A"))), output="B")
+        with self.assertRaises(ValueError):
+            p.order()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import sqlite3
+import unittest
+
+from spork import Entity
+from spork.dialect import Dialect
+from spork.dml import Insert, Merge, Upsert, literal
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+def connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    conn.execute("create table T (Id integer primary key, Name text, Amount real)")
+    return conn
+
+
+class TestDml(unittest.TestCase):
+    def test_insert_batches(self):
+        conn = connect()
+        rows = ((i, f"n{i}", i / 2) for i in range(2500))
+        load = Insert(Entity("T"), ["Id", "Name", "Amount"]).rows(rows)
+
+        sent = []
+        self.assertEqual(2500, load.execute(lambda sql, params: sent.append(conn.execute(sql, params))))
+        self.assertEqual(3, len(sent))
+        self.assertEqual((2500, 2499 * 2500 / 4), conn.execute("select count(*), sum(Amount) from T").fetchone())
+
+    def test_limits(self):
+        # Two parameters per row: at most two rows per statement
+        dialect = Dialect("tiny", max_params=5, max_statement_bytes=60, upsert="on conflict")
+        load = Insert(Entity("T"), ["Id", "Name"], dialect).rows([(1, "a"), (2, "b"), (3, "c")])
+        batches = list(load.batches())
+        self.assertEqual([2, 1], [b.rows for b in batches])
+        self.assertEqual("insert into T (Id, Name) values (?, ?), (?, ?)", batches[0].sql)
+        self.assertEqual([3, "c"], batches[1].params)
+
+        # Statement size
+        load = Insert(Entity("T"), ["Id", "Name"], dialect).rows([(i, "x" * 10) for i in range(3)])
+        batches = list(load.batches(parametrize=False))
+        self.assertTrue(all(len(b.sql) <= 60 for b in batches))
+        self.assertEqual(3, sum(b.rows for b in batches))
+
+        with self.assertRaises(ValueError):
+            list(Insert(Entity("T"), ["Id", "Name"], dialect).rows([(1, "x" * 100)]).batches(False))
+
+    def test_numbered_placeholders(self):
+        load = Insert(Entity("T"), ["Id", "Name"], "postgres").rows([(1, "a"), {"Name": "b", "Id": 2}])
+        (batch,) = load.batches()
+        self.assertEqual("insert into T (Id, Name) values (%s, %s), (%s, %s)", batch.sql)
+        self.assertEqual([1, "a", 2, "b"], batch.params)
+
+        dialect = Dialect("numbered", paramstyle="dollar", max_rows=1)
+        load = Insert(Entity("T"), ["Id", "Name"], dialect).rows([(1, "a"), (2, "b")])
+        self.assertEqual(
+            ["insert into T (Id, Name) values ($1, $2)"] * 2, [b.sql for b in load.batches()]
+        )
+
+    def test_upsert(self):
+        conn = connect()
+        Insert(Entity("T"), ["Id", "Name", "Amount"]).rows([(1, "a", 1.0), (2, "b", 2.0)]).execute(
+            conn.execute
+        )
+        Upsert(Entity("T"), ["Id", "Name", "Amount"], keys=["Id"], update=["Amount"]).rows(
+            [(2, "x", 20.0), (3, "c", 3.0)]
+        ).execute(conn.executemany, many=True)
+        self.assertEqual(
+            [(1, "a", 1.0), (2, "b", 20.0), (3, "c", 3.0)],
+            conn.execute("select * from T order by Id").fetchall(),
+        )
+
+    def test_merge(self):
+        load = Merge(Entity("T"), ["Id", "Name"], keys=["Id"]).rows([(1, "a"), (2, None)])
+        (batch,) = load.batches(parametrize=False)
+        self.assertEqual(
+            "merge into T t using (select 1 as Id, 'a' as Name union all select 2, null) s "
+            "on t.Id = s.Id when matched then update set Name = s.Name "
+            "when not matched then insert (Id, Name) values (s.Id, s.Name)",
+            batch.sql,
+        )
+
+        # The source is never aliased as the target
+        (batch,) = Merge(Entity("T").alias("s"), ["Id"], keys=["Id"]).rows([(1,)]).batches()
+        self.assertIn("merge into T s using (select %s as Id) src on s.Id = src.Id", batch.sql)
+
+        # Engines without insert ... on conflict upsert through a merge
+        upsert = Upsert(Entity("T"), ["Id", "Name"], keys=["Id"], dialect="snowflake")
+        (batch,) = upsert.rows([(1, "a")]).batches()
+        self.assertTrue(batch.sql.startswith("merge into T t using (select %s as Id, %s as Name) s"))
+
+    def test_literal(self):
+        self.assertEqual("'it''s'", literal("it's"))
+        self.assertEqual("null", literal(None))
+        self.assertEqual("true", literal(True))
+        with self.assertRaises(TypeError):
+            literal(object())
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_columns(self):
+        conn = connect()
+        load = Insert(Entity("T"), ["Id", "Amount"], batch_rows=100).from_columns(
+            {"Id": np.arange(250), "Amount": np.linspace(0, 1, 250)}
+        )
+        self.assertEqual(250, load.execute(conn.execute))
+        self.assertEqual((250,), conn.execute("select count(*) from T").fetchone())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -165,6 +165,45 @@ class TestExpression(unittest.TestCase):
         self.assertEqual("Nullables is null", exp_is)
         self.assertEqual("Nullables is not null", exp_is_not)
 
+    def test_compile_python(self):
+        pred = ((Expression("a") > Expression(1)) & ~Expression("b").is_null()).compile_python()
+
+        self.assertTrue(pred({"a": 2, "b": "x"}))
+        self.assertFalse(pred({"a": 0, "b": "x"}))
+        self.assertFalse(pred({"a": 2, "b": None}))
+
+        # False and NULL is false, true and NULL is NULL
+        self.assertFalse(pred({"a": None, "b": None}))
+        self.assertIsNone(pred({"a": None, "b": "x"}))
+
+        # True or NULL is true, false or NULL is NULL
+        pred = (Expression("a").eq(Expression("'x'")) | (Expression("b") < Expression(3))).compile_python()
+        self.assertTrue(pred({"a": "x", "b": None}))
+        self.assertIsNone(pred({"a": "y", "b": None}))
+        self.assertIsNone(pred({"a": None, "b": None}))
+        self.assertFalse(pred({"a": "y", "b": 5}))
+
+    def test_compile_python_arithmetic(self):
+        between = Expression("a").between(Expression(1), Expression("b") * Expression(2))
+        pred = between.compile_python(columns=["t.a", "t.b"])
+        self.assertEqual(
+            [True, False, None, None],
+            [pred(row) for row in [(4, 2), (5, 2), (None, 2), (3, None)]],
+        )
+        # A null bound leaves the other to decide
+        pred = Expression("a").between(Expression("null"), Expression(5)).compile_python()
+        self.assertEqual([None, False, None], [pred({"a": a}) for a in (3, 7, None)])
+
+        self.assertEqual(-3, (Expression("a") / Expression(2)).compile_python()({"a": -7}))
+        self.assertEqual(-1, (Expression("a") % Expression(3)).compile_python()({"a": -7}))
+        self.assertIsNone((Expression("a") / Expression(0)).compile_python()({"a": 1}))
+        self.assertEqual(2.5, (Expression("a").cast("float") / Expression(2)).compile_python()({"a": 5}))
+
+        # Records can be filtered directly
+        pred = (Expression("a") >= Expression(2)).compile_python()
+        rows = [{"a": 1}, {"a": None}, {"a": 2}, {"a": 3}]
+        self.assertEqual([{"a": 2}, {"a": 3}], list(filter(pred, rows)))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+
+from spork import col, lit, Selection, Dataset, Query, Entity
+from spork.harness import Fixture, Harness, Regression, SQLiteBackend, Table, integers, serial
+
+
+TABLES = [Table("Fact", 500, {"Id": serial(), "DimId": integers(1, 50)}, indexes=[("DimId",)])]
+
+
+def fixture(where) -> Fixture:
+    return Fixture("lookup", Query(Selection("Id"), Dataset(Entity("Fact"))).where(where), TABLES)
+
+
+class TestHarness(unittest.TestCase):
+    def test_unchanged_plan(self):
+        h = Harness([fixture(col("DimId").eq(lit(3)))], repeat=1)
+        self.assertEqual(
+            [],
+            [r for r in h.compare(h.capture(), h.capture()) if r.kind != Regression.SLOWER],
+        )
+
+    def test_backends_are_closed(self):
+        opened, closed = [], []
+
+        class Tracked(SQLiteBackend):
+            def __init__(self):
+                super().__init__()
+                opened.append(self)
+
+            def close(self):
+                closed.append(self)
+                super().close()
+
+        h = Harness([fixture(col("DimId").eq(lit(3)))], backend=Tracked, repeat=1)
+        h.compare(h.capture(), h.capture())
+        self.assertEqual(3, len(opened))
+        self.assertEqual(opened, closed)
+
+    def test_lost_index(self):
+        indexed = Harness([fixture(col("DimId").eq(lit(3)))], repeat=1)
+        scanned = Harness([fixture((col("DimId") + lit(0)).eq(lit(3)))], repeat=1)
+
+        kinds = {r.kind for r in scanned.compare(indexed.capture(), scanned.capture())}
+        self.assertLessEqual(
+            {Regression.NEW_SCAN, Regression.LOST_INDEX, Regression.PLAN_CHANGED}, kinds
+        )
+
+    def test_check_writes_baseline(self):
+        h = Harness([fixture(col("DimId").eq(lit(3)))], repeat=1)
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "baseline.json")
+            self.assertEqual([], h.check(path))
+            self.assertTrue(os.path.exists(path))
+
+    def test_seeded_data(self):
+        self.assertEqual(TABLES[0].generate(1), TABLES[0].generate(1))
+        self.assertNotEqual(TABLES[0].generate(1), TABLES[0].generate(2))
+
+
+if __name__ == "__main__":
+    unittest.main()
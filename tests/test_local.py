@@ -0,0 +1,188 @@
+import sqlite3
+import unittest
+
+from spork import col, lit, row_number, lag, lead, rank, count, sum, avg, max
+from spork import Selection, Dataset, Join, Query, Entity, Window
+from spork import unbounded_preceding, unbounded_following, current_row
+from spork.func_expr import FuncExpr
+from spork.types import FuncLabel
+
+try:
+    import numpy as np
+    from spork.local import execute
+except ImportError:  # pragma: no cover
+    np = None
+
+
+TABLES = {
+    "Fact": {
+        "Id": [1, 2, 3, 4, 5, 6],
+        "DimId": [10, 10, 20, None, 30, 20],
+        "Amount": [1.5, 2.0, 3.0, 4.0, 5.0, None],
+        "Qty": [7, -7, 3, 0, 9, 2],
+    },
+    "Dim": {"DimId": [10, 20, 40], "Name": ["a", "b", "d"]},
+}
+
+
+def sqlite_rows(query: Query):
+    conn = sqlite3.connect(":memory:")
+    for ref, table in TABLES.items():
+        names = list(table)
+        conn.execute(f"create table {ref} ({', '.join(names)})")
+        conn.executemany(
+            f"insert into {ref} values ({', '.join('?' for _ in names)})",
+            list(zip(*table.values())),
+        )
+    return conn.execute(query.to_string()).fetchall()
+
+
+def local_rows(query: Query):
+    result = execute(query, TABLES)
+    cols = [[None if v is np.ma.masked else v.item() for v in c] for c in result.values()]
+    return list(zip(*cols))
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestLocal(unittest.TestCase):
+    def assertMatchesSqlite(self, query: Query, ordered: bool = True):
+        expected, actual = sqlite_rows(query), local_rows(query)
+        if not ordered:
+            # sqlite sorts nulls first
+            key = lambda row: [(v is not None, v) for v in row]
+            expected, actual = sorted(expected, key=key), sorted(actual, key=key)
+        self.assertEqual(expected, actual)
+
+    def test_filter_and_arithmetic(self):
+        q = (
+            Query(
+                Selection("Id", (col("Qty") / lit(2)).alias("Half"), (col("Qty") % lit(4)).alias("Mod")),
+                Dataset(Entity("Fact")),
+            )
+            .where(col("Amount").between(lit(1), lit(4)) | col("Amount").is_null())
+            .order_by("Id")
+        )
+        self.assertMatchesSqlite(q)
+
+    def test_aliases(self):
+        # An alias is not visible to the rest of the selection, and never hides a column
+        q = Query(
+            Selection((col("Id") * lit(100)).alias("Qty"), col("Qty").alias("Orig")),
+            Dataset(Entity("Fact")),
+        ).order_by("Id")
+        self.assertMatchesSqlite(q)
+
+    def test_joins(self):
+        for how in ("inner", "left", "right", "full outer"):
+            q = Query(
+                Selection("f.Id", "d.Name"),
+                Dataset(
+                    Entity("Fact").alias("f"),
+                    Join(Entity("Dim").alias("d"), col("d.DimId").eq(col("f.DimId")) & (col("f.Qty") > lit(0)), how),
+                ),
+            )
+            with self.subTest(how=how):
+                self.assertMatchesSqlite(q, ordered=False)
+
+    def test_duplicate_names(self):
+        dataset = Dataset(
+            Entity("Fact").alias("f"), Join(Entity("Dim").alias("d"), col("d.DimId").eq(col("f.DimId")))
+        )
+        # Result columns are keyed by name, so names must be unique, ignoring case
+        for selection in (Selection("f.DimId", "d.DimId"), Selection("f.Id", col("d.Name").alias("ID"))):
+            with self.subTest(selection=selection.to_string()), self.assertRaises(ValueError):
+                local_rows(Query(selection, dataset))
+
+        q = Query(Selection("f.DimId", col("d.DimId").alias("DimId2")), dataset)
+        self.assertMatchesSqlite(q, ordered=False)
+
+    def test_anti_join(self):
+        q = Query(
+            Selection("f.Id"),
+            Dataset(
+                Entity("Fact").alias("f"),
+                Join(Entity("Dim").alias("d"), col("d.DimId").eq(col("f.DimId")), "left anti"),
+            ),
+        ).order_by("f.Id")
+        self.assertEqual([(4,), (5,)], local_rows(q))
+
+    def test_group_by(self):
+        q = (
+            Query(
+                Selection(
+                    "DimId",
+                    count().alias("n"),
+                    count("Amount").alias("na"),
+                    sum("Qty").alias("s"),
+                    avg("Amount").alias("a"),
+                    max("Id").alias("m"),
+                ),
+                Dataset(Entity("Fact")),
+            )
+            .where(col("DimId").is_not_null())
+            .group_by("DimId")
+            .having(count() > lit(1))
+            .order_by(col("DimId").desc())
+        )
+        self.assertMatchesSqlite(q)
+
+    def test_aggregate_over_no_rows(self):
+        q = Query(
+            Selection(count().alias("n"), sum("Qty").alias("s"), avg("Amount").alias("a"), max("Id").alias("m")),
+            Dataset(Entity("Fact")),
+        ).where(col("Id") > lit(10))
+        self.assertMatchesSqlite(q)
+
+        # Plain columns of the empty group are null too
+        q = Query(Selection("DimId", count().alias("n")), Dataset(Entity("Fact"))).where(col("Id") > lit(10))
+        self.assertMatchesSqlite(q)
+
+    def test_windows(self):
+        q = Query(
+            Selection(
+                "Id",
+                row_number().over(Window().partition_by("DimId").order_by("Id").desc()).alias("rn"),
+                rank().over(Window().order_by("Qty")).alias("rk"),
+                lag("Id").over(Window().partition_by("DimId").order_by("Id")).alias("prev"),
+                lead("Id", 1, "0").over(Window().order_by("Id")).alias("next"),
+            ),
+            Dataset(Entity("Fact")),
+        ).order_by("Id")
+        self.assertMatchesSqlite(q)
+
+    def test_window_frames(self):
+        def query(lb, ub) -> Query:
+            window = Window().partition_by("DimId").order_by("Id").rows_between(lb, ub)
+            return Query(
+                Selection(
+                    "Id",
+                    FuncExpr(f=FuncLabel.FIRST_VALUE, args=[col("Qty")]).over(window).alias("f"),
+                    FuncExpr(f=FuncLabel.LAST_VALUE, args=[col("Qty")]).over(window).alias("l"),
+                ),
+                Dataset(Entity("Fact")),
+            ).order_by("Id")
+
+        for ub in (current_row(), unbounded_following()):
+            with self.subTest(ub=ub.value):
+                self.assertMatchesSqlite(query(unbounded_preceding(), ub))
+
+        # Offsets do not render as valid sqlite
+        self.assertEqual(
+            [(1, 7, -7), (2, 7, -7), (3, 3, 2), (4, 0, 0), (5, 9, 9), (6, 3, 2)],
+            local_rows(query(current_row() - 1, current_row() + 1)),
+        )
+        self.assertEqual(
+            [(1, -7, -7), (2, None, None), (3, 2, 2), (4, None, None), (5, None, None), (6, None, None)],
+            local_rows(query(current_row() + 1, unbounded_following())),
+        )
+
+    def test_null_ordering(self):
+        q = Query(Selection("Id"), Dataset(Entity("Fact"))).order_by(col("DimId"), col("Id").desc())
+        self.assertEqual([2, 1, 6, 3, 5, 4], [r[0] for r in local_rows(q)])
+
+        q = Query(Selection("Id"), Dataset(Entity("Fact"))).order_by(col("DimId").desc(), "Id")
+        self.assertEqual([4, 5, 3, 6, 1, 2], [r[0] for r in local_rows(q)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,188 @@
+import unittest
+
+from spork import col, lit, row_number, Selection, Dataset, Join, Query, Entity, Window
+from spork.optimizer import eliminate_joins, prune_projections, optimize, order_predicates
+from spork.stats import ColumnStats, Statistics
+
+
+class TestOptimizer(unittest.TestCase):
+    def test_eliminate_unreferenced_left_join(self):
+        q = Query(
+            Selection("f.Id", "f.Amount"),
+            Dataset(
+                Entity("Fact").alias("f"),
+                Join(
+                    Entity("Dim").alias("d").unique("DimId"),
+                    col("d.DimId").eq(col("f.DimId")),
+                    "left",
+                ),
+            ),
+        )
+
+        self.assertEqual(
+            "select\nf.Id,\nf.Amount\nfrom Fact f\n", eliminate_joins(q).to_string()
+        )
+
+        # The original query is untouched
+        self.assertEqual(1, len(q.dataset.joins))
+
+    def test_keep_joins_that_matter(self):
+        dim = Entity("Dim").alias("d").unique("DimId")
+        on = col("d.DimId").eq(col("f.DimId"))
+
+        # Referenced
+        q = Query(
+            Selection("f.Id", "d.Name"),
+            Dataset(Entity("Fact").alias("f"), Join(dim, on, "left")),
+        )
+        self.assertEqual(1, len(eliminate_joins(q).dataset.joins))
+
+        # Inner joins filter rows
+        q = Query(Selection("f.Id"), Dataset(Entity("Fact").alias("f"), Join(dim, on)))
+        self.assertEqual(1, len(eliminate_joins(q).dataset.joins))
+
+        # Not joined on a unique key
+        q = Query(
+            Selection("f.Id"),
+            Dataset(
+                Entity("Fact").alias("f"),
+                Join(Entity("Other").alias("o"), col("o.DimId").eq(col("f.DimId")), "left"),
+            ),
+        )
+        self.assertEqual(1, len(eliminate_joins(q).dataset.joins))
+
+        # Bare columns might come from the joined entity
+        q = Query(Selection("Id"), Dataset(Entity("Fact").alias("f"), Join(dim, on, "left")))
+        self.assertEqual(1, len(eliminate_joins(q).dataset.joins))
+
+        # ...even when selected under their own name
+        q = Query(
+            Selection("f.Id", col("Name").alias("Name")),
+            Dataset(Entity("Fact").alias("f"), Join(dim, on, "left")),
+        ).order_by("Name")
+        self.assertEqual(1, len(eliminate_joins(q).dataset.joins))
+
+        # Selection aliases are only visible to order by, having and qualify
+        q = Query(
+            Selection("f.Id", col("f.Amount").alias("Name")),
+            Dataset(Entity("Fact").alias("f"), Join(dim, on, "left")),
+        ).order_by("Name")
+        self.assertEqual(0, len(eliminate_joins(q).dataset.joins))
+        q.where(col("Name").eq(lit("'x'")))
+        self.assertEqual(1, len(eliminate_joins(q).dataset.joins))
+
+    def test_eliminate_grouped_subquery(self):
+        sub = (
+            Query(Selection("DimId", col("max(Value)").alias("MaxValue")), Dataset(Entity("Dim")))
+            .group_by("DimId")
+            .alias("s")
+        )
+        q = Query(
+            Selection("f.Id", "Amount"),
+            Dataset(Entity("Fact").alias("f"), Join(sub, col("s.DimId").eq(col("f.DimId")), "left")),
+        )
+        self.assertEqual(0, len(eliminate_joins(q).dataset.joins))
+
+    def test_prune_projections(self):
+        sub = (
+            Query(
+                Selection(
+                    "Id",
+                    "Unused",
+                    "Kept",
+                    row_number().over(Window().partition_by("Id").order_by("Ts")).alias("rn"),
+                ),
+                Dataset(Entity("Dim")),
+            )
+            .qualify(col("rn").eq(lit(1)))
+            .alias("s")
+        )
+        q = Query(
+            Selection("f.Id", "s.Kept"),
+            Dataset(Entity("Fact").alias("f"), Join(sub, col("s.Id").eq(col("f.Id")))),
+        )
+
+        pruned = prune_projections(q).dataset.joins[0].what
+        self.assertEqual(
+            ["Id", "Kept", "row_number() over (partition by Id order by Ts "
+             "rows between unbounded preceding and current row) as rn"],
+            [exp.to_string() for exp in pruned.selection.cols],
+        )
+
+        # Star selections need every column
+        q = Query(Selection("*"), Dataset(Entity("Fact").alias("f"), Join(sub, col("s.Id").eq(col("f.Id")))))
+        self.assertEqual(4, len(prune_projections(q).dataset.joins[0].what.selection.cols))
+
+    def test_optimize(self):
+        sub = Query(Selection("Id", "Name", "Extra"), Dataset(Entity("Dim"))).alias("s")
+        q = Query(
+            Selection("f.Id", "s.Name"),
+            Dataset(
+                Entity("Fact").alias("f"),
+                Join(sub, col("s.Id").eq(col("f.DimId")), "left"),
+                Join(Entity("Unused").alias("u").unique("Id"), col("u.Id").eq(col("s.Extra")), "left"),
+            ),
+        )
+        optimized = optimize(q)
+        self.assertEqual(1, len(optimized.dataset.joins))
+        self.assertEqual(
+            ["Id", "Name"], [exp.to_string() for exp in optimized.dataset.joins[0].what.selection.cols]
+        )
+
+    def test_order_predicates(self):
+        stats = Statistics(
+            {
+                "Fact.Status": ColumnStats(distinct=3),
+                "Fact.Id": ColumnStats(distinct=100000),
+                "Amount": ColumnStats(histogram=[0, 10, 20, 30, 100]),
+            }
+        )
+        q = Query(Selection("f.Id"), Dataset(Entity("Fact").alias("f"))).where(
+            col("f.Status").eq(lit("'x'"))
+            & col("Name").cast("text").eq(lit("'y'"))
+            & col("f.Id").eq(lit(5))
+            & (col("Amount") > lit(95))
+        )
+
+        self.assertEqual(
+            "((((f.Id = 5) and (Amount > 95)) and (f.Status = 'x')) and (Name::text = 'y'))",
+            order_predicates(q, stats)._where.to_string(),
+        )
+
+    def test_keep_guards_first(self):
+        # x <> 0 is hardly ever false, so without the guard it would go last
+        stats = Statistics({"x": ColumnStats(distinct=1000), "y": ColumnStats(distinct=1000)})
+        q = Query(Selection("Id"), Dataset(Entity("Fact"))).where(
+            col("x").neq(lit(0)) & ((lit(100) / col("x")) > lit(5)) & col("y").eq(lit(1))
+        )
+
+        # The division stays behind its guard, but the cheap selective test may move ahead
+        self.assertEqual(
+            "(((y = 1) and (x <> 0)) and ((100 / x) > 5))",
+            order_predicates(q, stats)._where.to_string(),
+        )
+
+        q = Query(Selection("Id"), Dataset(Entity("Fact"))).where(
+            col("x").neq(lit(0)) & ((lit(100) / col("x")) > lit(5))
+        )
+        self.assertEqual(
+            "((x <> 0) and ((100 / x) > 5))", order_predicates(q, stats)._where.to_string()
+        )
+
+    def test_order_disjuncts(self):
+        stats = Statistics({"Status": ColumnStats(distinct=2), "Id": ColumnStats(distinct=1000)})
+        on = (col("d.Id").eq(lit(1)) | col("d.Status").eq(lit(1))) & ~col("d.Id").is_null()
+        q = Query(
+            Selection("f.Id"),
+            Dataset(Entity("Fact").alias("f"), Join(Entity("Dim").alias("d"), on)),
+        )
+
+        # Likely-true operands go first in an or; negations and inner chains keep their shape
+        self.assertEqual(
+            "(((d.Status = 1) or (d.Id = 1)) and not d.Id is null)",
+            order_predicates(q, stats).dataset.joins[0].on.to_string(),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
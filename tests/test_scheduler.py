@@ -0,0 +1,164 @@
+import queue
+import threading
+import time
+import unittest
+
+from spork import col, row_number, Selection, Dataset, Join, Query, Entity, Window
+from spork import unbounded_following, unbounded_preceding
+from spork.scheduler import BATCH, INTERACTIVE, Scheduler, query_weight
+
+
+def query(name: str) -> Query:
+    return Query(Selection("Id"), Dataset(Entity(name)))
+
+
+def wait_until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out")
+        time.sleep(0.001)
+
+
+class Recorder:
+    """
+    An executor that records the order queries start in, and holds them until released.
+    """
+
+    def __init__(self):
+        self.started = []
+        self.gates = {}
+        self.lock = threading.Lock()
+
+    def gate(self, name: str) -> threading.Event:
+        return self.gates.setdefault(name, threading.Event())
+
+    def __call__(self, sql, params):
+        name = sql.split("from ")[1].strip()
+        with self.lock:
+            self.started.append(name)
+            gate = self.gate(name)
+        gate.wait(5)
+        if name == "Broken":
+            raise ValueError("boom")
+        return name
+
+    def release_all(self):
+        for name in ["Blocker", "A1", "A2", "A3", "B1", "Batch", "Interactive", "Heavy", "Small1", "Small2", "Small3"]:
+            self.gate(name).set()
+
+
+class TestScheduler(unittest.TestCase):
+    def test_query_weight(self):
+        self.assertEqual(1.0, query_weight(query("Fact")))
+
+        joined = Query(
+            Selection("f.Id"),
+            Dataset(Entity("Fact").alias("f"), Join(Entity("Dim").alias("d"), col("d.Id").eq(col("f.DimId")))),
+        )
+        self.assertEqual(2.0, query_weight(joined))
+
+        running = Query(Selection(row_number().over(Window().order_by("Id"))), Dataset(Entity("Fact")))
+        whole = Query(
+            Selection(
+                row_number().over(Window().order_by("Id").rows_between(unbounded_preceding(), unbounded_following()))
+            ),
+            Dataset(Entity("Fact")),
+        )
+        self.assertLess(query_weight(joined), query_weight(running))
+        self.assertLess(query_weight(running), query_weight(whole))
+
+    def test_priority_and_fairness(self):
+        rec = Recorder()
+        scheduler = Scheduler(rec, budget=1.0)
+        scheduler.submit(query("Blocker"))
+        futures = [
+            scheduler.submit(query("Batch"), priority=BATCH),
+            scheduler.submit(query("A1"), tenant="a"),
+            scheduler.submit(query("A2"), tenant="a"),
+            scheduler.submit(query("B1"), tenant="b"),
+            scheduler.submit(query("Interactive"), priority=INTERACTIVE),
+        ]
+        self.assertEqual(5, scheduler.queued())
+
+        # The budget admits one query at a time, so they start in scheduling order
+        rec.release_all()
+        for f in futures:
+            f.result(5)
+        scheduler.shutdown()
+        self.assertEqual(["Blocker", "Interactive", "A1", "B1", "A2", "Batch"], rec.started)
+
+    def test_priority_with_few_workers(self):
+        rec = Recorder()
+        scheduler = Scheduler(rec, budget=16.0, workers=1)
+        scheduler.submit(query("Blocker"))
+        futures = [scheduler.submit(query("Batch"), priority=BATCH) for _ in range(3)]
+        futures.append(scheduler.submit(query("Interactive"), priority=INTERACTIVE))
+
+        # The budget would admit them all, but only one can run at a time
+        self.assertEqual(4, scheduler.queued())
+        rec.release_all()
+        for f in futures:
+            f.result(5)
+        scheduler.shutdown()
+        self.assertEqual(["Blocker", "Interactive", "Batch", "Batch", "Batch"], rec.started)
+
+    def test_budget(self):
+        lock, running, peak = threading.Lock(), [0.0], [0.0]
+
+        def executor(sql, params):
+            with lock:
+                running[0] += params
+                peak[0] = max(peak[0], running[0])
+            threading.Event().wait(0.01)
+            with lock:
+                running[0] -= params
+            return params
+
+        with Scheduler(executor, budget=4.0, workers=8) as scheduler:
+            futures = [scheduler.submit(query("Fact"), w, weight=w) for w in [1, 3, 2, 2, 1, 4, 1]]
+            # Heavier than the whole budget: runs alone
+            futures.append(scheduler.submit(query("Fact"), 6, weight=6))
+            self.assertEqual([1, 3, 2, 2, 1, 4, 1, 6], [f.result(5) for f in futures])
+        self.assertLessEqual(peak[0], 6.0)
+        self.assertEqual(0.0, scheduler.in_flight())
+
+    def test_backfill_is_bounded(self):
+        rec = Recorder()
+        scheduler = Scheduler(rec, budget=2.0, backfill=1)
+        scheduler.submit(query("Blocker"), weight=1.0)
+        heavy = scheduler.submit(query("Heavy"), weight=2.0)
+        small = [scheduler.submit(query(f"Small{n}"), weight=1.0) for n in (1, 2)]
+
+        # One small query starts ahead of the blocked heavy one
+        wait_until(lambda: len(rec.started) == 2)
+        self.assertEqual(["Blocker", "Small1"], rec.started)
+
+        # The next one would fit once the first finishes, but has to wait for the heavy one
+        rec.gate("Blocker").set()
+        wait_until(lambda: scheduler.in_flight() == 1.0)
+        self.assertEqual(["Blocker", "Small1"], rec.started)
+
+        rec.release_all()
+        heavy.result(5)
+        small[1].result(5)
+        scheduler.shutdown()
+        self.assertEqual(["Blocker", "Small1", "Heavy", "Small2"], rec.started)
+
+    def test_errors_and_backpressure(self):
+        rec = Recorder()
+        scheduler = Scheduler(rec, budget=1.0, max_queued=1)
+        broken = scheduler.submit(query("Broken"))
+        scheduler.submit(query("A1"))
+        with self.assertRaises(queue.Full):
+            scheduler.submit(query("A2"), block=False)
+
+        rec.gate("Broken").set()
+        with self.assertRaises(ValueError):
+            broken.result(5)
+        rec.release_all()
+        scheduler.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from spork import Selection, Dataset, Query, Entity
+from spork.singleflight import QueryCoalescer, SingleFlight
+
+
+def query() -> Query:
+    return Query(Selection("Id"), Dataset(Entity("Fact")))
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_threads_share_one_call(self):
+        calls, release = [], threading.Event()
+
+        def executor(sql, params):
+            calls.append(sql)
+            release.wait(5)
+            return ["row"]
+
+        coalescer = QueryCoalescer(executor)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(coalescer.execute(query(), {"a": [1]})))
+            for _ in range(8)
+        ]
+        for t in threads:
+            t.start()
+        while coalescer.flight.in_flight() == 0:
+            time.sleep(0.001)
+        time.sleep(0.1)
+        release.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual([["row"]] * 8, results)
+        self.assertIs(results[0], results[1])
+
+        # Completed calls are not cached
+        coalescer.execute(query(), {"a": [1]})
+        self.assertEqual(2, len(calls))
+
+    def test_asyncio_shares_one_call_and_error(self):
+        calls = []
+
+        async def executor(sql, params):
+            calls.append(params)
+            await asyncio.sleep(0.05)
+            if params == 2:
+                raise RuntimeError("boom")
+            return params
+
+        async def main():
+            coalescer = QueryCoalescer(async_executor=executor)
+            ok = await asyncio.gather(*[coalescer.execute_async(query(), 1) for _ in range(5)])
+            failed = await asyncio.gather(
+                *[coalescer.execute_async(query(), 2) for _ in range(5)], return_exceptions=True
+            )
+            return ok, failed
+
+        ok, failed = asyncio.run(main())
+        self.assertEqual([1] * 5, ok)
+        self.assertEqual(2, len(calls))
+        self.assertTrue(all(isinstance(e, RuntimeError) for e in failed))
+        self.assertTrue(all(e is failed[0] for e in failed))
+
+    def test_leader_cancelled(self):
+        calls = []
+
+        async def executor(sql, params):
+            calls.append(params)
+            await asyncio.sleep(0.05)
+            return params
+
+        async def main():
+            coalescer = QueryCoalescer(async_executor=executor)
+            leader = asyncio.ensure_future(coalescer.execute_async(query(), 1))
+            await asyncio.sleep(0.01)
+            waiter = asyncio.ensure_future(coalescer.execute_async(query(), 1))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await waiter, leader
+
+        result, leader = asyncio.run(main())
+        self.assertEqual(1, result)
+        self.assertTrue(leader.cancelled())
+        self.assertEqual([1], calls)
+
+    def test_interrupted_call_is_not_shared(self):
+        flight, started, release = SingleFlight(), threading.Event(), threading.Event()
+        results = []
+
+        def interrupted():
+            started.set()
+            release.wait(5)
+            raise KeyboardInterrupt()
+
+        def leader():
+            try:
+                flight.do("k", interrupted)
+            except KeyboardInterrupt:
+                results.append("interrupted")
+
+        t = threading.Thread(target=leader)
+        t.start()
+        started.wait(5)
+        waiter = threading.Thread(target=lambda: results.append(flight.do("k", lambda: "again")))
+        waiter.start()
+        time.sleep(0.05)
+        release.set()
+        t.join()
+        waiter.join()
+        # The waiter makes the call itself rather than raise the leader's interruption
+        self.assertCountEqual(["interrupted", "again"], results)
+
+    def test_thread_waits_for_async_call(self):
+        flight, started = SingleFlight(), threading.Event()
+        results = []
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(0.1)
+            return "done"
+
+        leader = threading.Thread(target=lambda: results.append(asyncio.run(flight.do_async("k", slow))))
+        leader.start()
+        started.wait(5)
+        results.append(flight.do("k", lambda: "not called"))
+        leader.join()
+        self.assertEqual(["done", "done"], results)
+
+
+if __name__ == "__main__":
+    unittest.main()
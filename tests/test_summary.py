@@ -0,0 +1,90 @@
+import unittest
+
+from spork import col, lit, count, sum, avg, max, Selection, Dataset, Query, Entity
+from spork.summary import SummaryRegistry
+
+
+def dataset() -> Dataset:
+    return Dataset(Entity("Sales").alias("s"))
+
+
+class TestSummary(unittest.TestCase):
+    def setUp(self):
+        daily = (
+            Query(
+                Selection(
+                    "s.Day",
+                    "s.Region",
+                    "s.Product",
+                    sum("s.Amount").alias("Amount"),
+                    count("s.Amount").alias("AmountCount"),
+                    count().alias("Rows"),
+                    max("s.Amount").alias("MaxAmount"),
+                ),
+                dataset(),
+            )
+            .where(col("s.Valid").eq(lit(1)))
+            .group_by("s.Day", "s.Region", "s.Product")
+        )
+        self.registry = SummaryRegistry().register(Entity("SalesDaily").alias("d"), daily)
+
+    def test_rewrite(self):
+        q = (
+            Query(
+                Selection("s.Region", sum("s.Amount").alias("Total"), count().alias("n"), avg("s.Amount")),
+                dataset(),
+            )
+            .where(col("s.Valid").eq(lit(1)) & col("s.Day").eq(lit("'2024-01-01'")))
+            .group_by("s.Region")
+            .having(count() > lit(10))
+            .order_by(col("Total").desc())
+        )
+        self.assertEqual(
+            "select\n"
+            "d.Region,\n"
+            "sum(d.Amount) as Total,\n"
+            "sum(d.Rows) as n,\n"
+            "(sum(d.Amount)::decimal / sum(d.AmountCount))\n"
+            "from SalesDaily d\n"
+            "\n"
+            "where (d.Day = '2024-01-01')\n"
+            "group by d.Region\n"
+            "having (sum(d.Rows) > 10)\n"
+            "order by Total desc",
+            self.registry.rewrite(q).to_string(),
+        )
+
+    def test_ungrouped_count(self):
+        q = Query(Selection(count().alias("n"), max("s.Amount").alias("m")), dataset()).where(
+            col("s.Valid").eq(lit(1))
+        )
+        self.assertEqual(
+            "select\ncoalesce(sum(d.Rows), 0) as n,\nmax(d.MaxAmount) as m\nfrom SalesDaily d\n",
+            self.registry.rewrite(q).to_string(),
+        )
+
+    def test_no_match(self):
+        cases = [
+            # The summary's where clause is not implied
+            Query(Selection("s.Region", sum("s.Amount")), dataset()).group_by("s.Region"),
+            # Grouping by a column the summary does not have
+            Query(Selection("s.Customer", sum("s.Amount")), dataset())
+            .where(col("s.Valid").eq(lit(1)))
+            .group_by("s.Customer"),
+            # Filtering on a column the summary does not have
+            Query(Selection(sum("s.Amount")), dataset())
+            .where(col("s.Valid").eq(lit(1)) & (col("s.Amount") > lit(5))),
+            # An aggregate the summary does not store
+            Query(Selection("s.Region", max("s.Price")), dataset())
+            .where(col("s.Valid").eq(lit(1)))
+            .group_by("s.Region"),
+            # Not an aggregate query
+            Query(Selection("s.Region"), dataset()).where(col("s.Valid").eq(lit(1))),
+        ]
+        for q in cases:
+            with self.subTest(q=q.to_string()):
+                self.assertIs(q, self.registry.rewrite(q))
+
+
+if __name__ == "__main__":
+    unittest.main()